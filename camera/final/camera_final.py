@@ -34,12 +34,25 @@ def init_glfw(width, height, title):
     return window
 
 
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    glBufferData(target, data.nbytes, data, usage)
+
+
 def bind_vertices(vertices, attributes):
-    vertices = (GLfloat * len(vertices))(*vertices)
     array_id = glGenVertexArrays(1)
     glBindVertexArray(array_id)
     glBindBuffer(GL_ARRAY_BUFFER, glGenBuffers(1))
-    glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), vertices, GL_STATIC_DRAW)
+    upload_buffer(GL_ARRAY_BUFFER, vertices)
 
     vertex_size = sum(attributes)
     offset = 0
@@ -79,14 +92,13 @@ def resize(width, height, shader_program):
 
 def load_texture(filepath):
     img = Image.open(filepath).convert("RGBA")
-    img_data = numpy.array(list(img.getdata()), numpy.uint8)
     tex_id = glGenTextures(1)
     glBindTexture(GL_TEXTURE_2D, tex_id)
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img.tobytes())
     glGenerateMipmap(GL_TEXTURE_2D)
     glBindTexture(GL_TEXTURE_2D, 0)
     return tex_id
@@ -0,0 +1,62 @@
+import sys
+import time
+
+import glfw
+import numpy
+from OpenGL.GL import *
+
+from compute_template import DepthSort, init_glfw, upload_buffer
+
+COUNTS = [10 ** 4, 5 * 10 ** 4, 2 * 10 ** 5, 10 ** 6]
+REPEATS = 10
+
+
+def measure(function, *args):
+    glFinish()
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(*args)
+        glFinish()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def read_order(depth_sort):
+    order = numpy.empty(depth_sort.count, numpy.uint32)
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, depth_sort.order_buffer)
+    glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, order.nbytes, order)
+    return order
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or COUNTS
+
+    window = init_glfw(64, 64, "Depth sort benchmark")
+    glfw.hide_window(window)
+
+    rng = numpy.random.default_rng(0)
+    for count in counts:
+        params = rng.random((count, 4), numpy.float32)
+        params_buffer = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, params_buffer)
+        upload_buffer(GL_SHADER_STORAGE_BUFFER, params, GL_STREAM_DRAW)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, params_buffer)
+        depth_sort = DepthSort(count)
+
+        gpu_time = measure(depth_sort.sort_gpu)
+        # both orders put the keys in the same sequence, equal keys may come in a different order
+        keys = params[:, 2]
+        gpu_keys = keys[read_order(depth_sort)]
+        cpu_time = measure(depth_sort.sort_cpu, params_buffer)
+        assert numpy.array_equal(gpu_keys, keys[read_order(depth_sort)])
+
+        print(f"{count:9} particles  gpu bitonic {gpu_time * 1000:8.2f} ms   "
+              f"cpu argsort with readback {cpu_time * 1000:8.2f} ms")
+        glDeleteBuffers(3, [params_buffer, depth_sort.key_buffer, depth_sort.order_buffer])
+
+    glfw.terminate()
+
+
+if __name__ == "__main__":
+    main()
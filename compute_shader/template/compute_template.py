@@ -1,4 +1,3 @@
-import random
 import time
 from ctypes import sizeof, c_void_p
 
@@ -9,8 +8,19 @@ from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 from PIL import Image
 
+from spatial_grid import GRID_EXTENT, INTERACTION_RADIUS, INTERACTION_STIFFNESS, grid_dims
+
 width = 800
 height = 800
+GPU_SORT = "gpu"
+CPU_SORT = "cpu"
+# how the particles are put in draw order for blending: GPU_SORT, CPU_SORT or None to draw them as they are stored
+SORT_MODE = GPU_SORT
+SORT_LOCAL_SIZE = 256
+# particles push each other apart, found through a uniform grid; needs the update kernel to spread them out,
+# with all of them in one cell every particle is tested against every other one
+PARTICLE_INTERACTION = False
+GRID_LOCAL_SIZE = 256
 
 
 def read_shader_file(filename):
@@ -20,14 +30,13 @@ def read_shader_file(filename):
 
 def load_texture(filepath):
     img = Image.open(filepath).convert("RGBA")
-    img_data = numpy.array(list(img.getdata()), numpy.uint8)
     tex_id = glGenTextures(1)
     glBindTexture(GL_TEXTURE_2D, tex_id)
     glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_MIRRORED_REPEAT)
     glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_MIRRORED_REPEAT)
     glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
     glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img.tobytes())
     glGenerateMipmap(GL_TEXTURE_2D)
     glBindTexture(GL_TEXTURE_2D, 0)
     return tex_id
@@ -87,6 +96,161 @@ def get_color_data(particles):
     return numpy.array([x for p in particles for x in p.color], dtype='float32')
 
 
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    glBufferData(target, data.nbytes, data, usage)
+
+
+class DepthSort:
+    # fills the draw order buffer the vertex shader reads particles through, sorted back to front;
+    # the GPU path is a bitonic sort of (key, index) pairs padded to a power of two, the CPU path reads the
+    # particle parameters back and uses numpy.argsort
+    def __init__(self, count):
+        self.count = count
+        self.size = max(SORT_LOCAL_SIZE, 1 << (count - 1).bit_length())
+        self.key_program = build_comp_shader("sort_keys")
+        self.sort_program = build_comp_shader("bitonic_sort")
+        self.local_program = build_comp_shader("bitonic_sort_local")
+        self.params = numpy.empty((count, 4), numpy.float32)
+
+        self.key_buffer = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.key_buffer)
+        glBufferData(GL_SHADER_STORAGE_BUFFER, self.size * sizeof(GLfloat), None, GL_DYNAMIC_COPY)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 3, self.key_buffer)
+
+        self.order_buffer = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.order_buffer)
+        upload_buffer(GL_SHADER_STORAGE_BUFFER, numpy.arange(self.size, dtype=numpy.uint32), GL_DYNAMIC_COPY,
+                      numpy.uint32)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 4, self.order_buffer)
+
+    def dispatch(self, program, k, j):
+        glUseProgram(program)
+        glUniform1ui(glGetUniformLocation(program, "k"), k)
+        glUniform1ui(glGetUniformLocation(program, "j"), j)
+        glDispatchCompute(self.size // SORT_LOCAL_SIZE, 1, 1)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+
+    def sort_gpu(self):
+        glUseProgram(self.key_program)
+        glUniform1ui(glGetUniformLocation(self.key_program, "count"), self.count)
+        glDispatchCompute(self.size // SORT_LOCAL_SIZE, 1, 1)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+
+        k = 2
+        while k <= self.size:
+            # distances of a work group or more compare elements of different groups, one dispatch each;
+            # the shorter ones are all done by one dispatch in shared memory
+            j = k // 2
+            while j >= SORT_LOCAL_SIZE:
+                self.dispatch(self.sort_program, k, j)
+                j //= 2
+            self.dispatch(self.local_program, k, j)
+            k *= 2
+
+    def sort_cpu(self, params_buffer):
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, params_buffer)
+        glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, self.params.nbytes, self.params)
+        # the same key as sort_keys.comp, the oldest particles are drawn first
+        order = numpy.argsort(self.params[:, 2], kind="stable").astype(numpy.uint32)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.order_buffer)
+        glBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, order.nbytes, order)
+
+    def sort(self, mode, params_buffer):
+        if mode == GPU_SORT:
+            self.sort_gpu()
+        elif mode == CPU_SORT:
+            self.sort_cpu(params_buffer)
+
+
+class SpatialGrid:
+    # a counting sort of the particles by grid cell on the GPU: the cell of every particle is counted, the counts are
+    # prefix summed into the start of every cell and the particle indices are scattered into their cell's range;
+    # the interaction kernel then only visits the particles of the 3x3 cells around each particle
+    def __init__(self, count, radius=INTERACTION_RADIUS, extent=GRID_EXTENT, stiffness=INTERACTION_STIFFNESS):
+        self.count = count
+        self.radius = radius
+        self.extent = extent
+        self.stiffness = stiffness
+        self.dims = grid_dims(radius, extent)
+        self.cell_count = self.dims * self.dims
+        self.block_count = (self.cell_count + GRID_LOCAL_SIZE - 1) // GRID_LOCAL_SIZE
+        # the block totals are scanned by a single work group
+        if self.block_count > GRID_LOCAL_SIZE:
+            raise ValueError(f"A grid of {self.dims}x{self.dims} cells is too fine, "
+                             f"at most {GRID_LOCAL_SIZE * GRID_LOCAL_SIZE} cells are supported")
+
+        self.hash_program = build_comp_shader("grid_hash")
+        self.scan_blocks_program = build_comp_shader("grid_scan_blocks")
+        self.scan_sums_program = build_comp_shader("grid_scan_sums")
+        self.scan_add_program = build_comp_shader("grid_scan_add")
+        self.scatter_program = build_comp_shader("grid_scatter")
+        self.interact_program = build_comp_shader("grid_interact")
+
+        # binding: number of uint elements
+        sizes = {5: count, 6: self.cell_count, 7: self.cell_count, 8: self.cell_count, 9: GRID_LOCAL_SIZE,
+                 10: count}
+        self.buffers = {}
+        for binding, size in sizes.items():
+            self.buffers[binding] = glGenBuffers(1)
+            glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.buffers[binding])
+            glBufferData(GL_SHADER_STORAGE_BUFFER, size * sizeof(GLuint), None, GL_DYNAMIC_COPY)
+            glBindBufferBase(GL_SHADER_STORAGE_BUFFER, binding, self.buffers[binding])
+
+    def dispatch(self, program, groups, **uniforms):
+        glUseProgram(program)
+        for name, value in uniforms.items():
+            location = glGetUniformLocation(program, name)
+            if isinstance(value, float):
+                glUniform1f(location, value)
+            else:
+                glUniform1ui(location, value)
+        glDispatchCompute(groups, 1, 1)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+
+    def build(self):
+        particle_groups = (self.count + GRID_LOCAL_SIZE - 1) // GRID_LOCAL_SIZE
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.buffers[6])
+        glClearBufferData(GL_SHADER_STORAGE_BUFFER, GL_R32UI, GL_RED_INTEGER, GL_UNSIGNED_INT, None)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+
+        self.dispatch(self.hash_program, particle_groups, count=self.count, dims=self.dims,
+                      extent=float(self.extent), invCellSize=1 / self.radius)
+        self.dispatch(self.scan_blocks_program, self.block_count, cellCount=self.cell_count)
+        self.dispatch(self.scan_sums_program, 1, blockCount=self.block_count)
+        self.dispatch(self.scan_add_program, self.block_count, cellCount=self.cell_count)
+        self.dispatch(self.scatter_program, particle_groups, count=self.count)
+
+    def interact(self, delta_time):
+        self.dispatch(self.interact_program, (self.count + GRID_LOCAL_SIZE - 1) // GRID_LOCAL_SIZE,
+                      count=self.count, dims=self.dims, extent=float(self.extent), invCellSize=1 / self.radius,
+                      radius=float(self.radius), stiffness=float(self.stiffness), deltaTime=float(delta_time))
+
+    def update(self, delta_time):
+        self.build()
+        self.interact(delta_time)
+
+    def read(self, binding, size):
+        data = numpy.empty(size, numpy.uint32)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, self.buffers[binding])
+        glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, data.nbytes, data)
+        return data
+
+    def read_grid(self):
+        # the same tuple as spatial_grid.build_grid
+        return self.read(5, self.count), self.read(10, self.count), self.read(7, self.cell_count), \
+            self.read(8, self.cell_count)
+
+
 def main():
     PARTICLES_NUM = 200000
 
@@ -110,23 +274,23 @@ def main():
     glBindVertexArray(glGenVertexArrays(1))
     vertex_buffer = glGenBuffers(1)
     glBindBuffer(GL_ARRAY_BUFFER, vertex_buffer)
-    glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), (GLfloat * len(vertices))(*vertices), GL_STATIC_DRAW)
+    upload_buffer(GL_ARRAY_BUFFER, vertices)
 
     color_buffer = glGenBuffers(1)
     glBindBuffer(GL_ARRAY_BUFFER, color_buffer)
-    glBufferData(GL_ARRAY_BUFFER, PARTICLES_NUM * 4 * sizeof(GLfloat),
-                 np.array([random.random() for _ in range(4 * PARTICLES_NUM)], dtype=numpy.float32), GL_STATIC_DRAW)
+    upload_buffer(GL_ARRAY_BUFFER, np.random.random(4 * PARTICLES_NUM).astype(np.float32))
+    glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 2, color_buffer)
 
     pos_buffer = glGenBuffers(1)
     glBindBuffer(GL_ARRAY_BUFFER, pos_buffer)
-    glBufferData(GL_ARRAY_BUFFER, PARTICLES_NUM * 4 * sizeof(GLfloat),
-                 np.array([0 for _ in range(4 * PARTICLES_NUM)], dtype=numpy.float32), GL_STREAM_DRAW)
+    upload_buffer(GL_ARRAY_BUFFER, np.zeros(4 * PARTICLES_NUM, np.float32), GL_STREAM_DRAW)
     glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 0, pos_buffer)
 
     params_buffer = glGenBuffers(1)
     glBindBuffer(GL_ARRAY_BUFFER, params_buffer)
-    glBufferData(GL_ARRAY_BUFFER, PARTICLES_NUM * 4 * sizeof(GLfloat),
-                 np.array([j for i in range(PARTICLES_NUM) for j in (0, 0, i / PARTICLES_NUM * 4, 0)], dtype=numpy.float32), GL_STREAM_DRAW)
+    params = np.zeros((PARTICLES_NUM, 4), np.float32)
+    params[:, 2] = np.arange(PARTICLES_NUM) / PARTICLES_NUM * 4
+    upload_buffer(GL_ARRAY_BUFFER, params, GL_STREAM_DRAW)
     glBindBufferBase(GL_SHADER_STORAGE_BUFFER, 1, params_buffer)
 
     shader_program = build_shader("particles")
@@ -144,17 +308,11 @@ def main():
     glBindBuffer(GL_ARRAY_BUFFER, vertex_buffer)
     glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 2 * sizeof(GLfloat), c_void_p(0))
 
-    glEnableVertexAttribArray(1)
-    glBindBuffer(GL_ARRAY_BUFFER, pos_buffer)
-    glVertexAttribPointer(1, 4, GL_FLOAT, GL_FALSE, 4 * sizeof(GLfloat), c_void_p(0))
-
-    glEnableVertexAttribArray(2)
-    glBindBuffer(GL_ARRAY_BUFFER, color_buffer)
-    glVertexAttribPointer(2, 4, GL_FLOAT, GL_FALSE, 4 * sizeof(GLfloat), c_void_p(0))
-
     glVertexAttribDivisor(0, 0)
-    glVertexAttribDivisor(1, 1)
-    glVertexAttribDivisor(2, 1)
+
+    # the particle attributes are read from the storage buffers in draw order
+    depth_sort = DepthSort(PARTICLES_NUM)
+    grid = SpatialGrid(PARTICLES_NUM) if PARTICLE_INTERACTION else None
 
     glBindTexture(GL_TEXTURE_2D, tex)
 
@@ -171,7 +329,10 @@ def main():
         glUniform1f(delta_time_loc, delta_time)
         glUniform1f(time_loc, cur_time)
         glDispatchCompute((PARTICLES_NUM + 255) // 256, 1, 1)
-        glMemoryBarrier(GL_VERTEX_ATTRIB_ARRAY_BARRIER_BIT)
+        glMemoryBarrier(GL_SHADER_STORAGE_BARRIER_BIT)
+        if grid is not None:
+            grid.update(delta_time)
+        depth_sort.sort(SORT_MODE, params_buffer)
 
         glUseProgram(shader_program)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -3,14 +3,28 @@
 uniform float pTime;
 
 layout (location = 0) in vec2 vPos;
-layout (location = 1) in vec4 pPosSize;
-layout (location = 2) in vec4 pColor;
+
+layout(std430, binding = 0) readonly buffer ParticlePositionsAndSize {
+    vec4 positions[];
+};
+
+layout(std430, binding = 2) readonly buffer ParticleColors {
+    vec4 colors[];
+};
+
+// particle indices in the order they are drawn in, filled by the depth sort
+layout(std430, binding = 4) readonly buffer DrawOrder {
+    uint order[];
+};
 
 out vec2 texCoord;
 out vec4 color;
 
 void main()
 {
+    uint particle = order[gl_InstanceID];
+    vec4 pPosSize = positions[particle];
+    vec4 pColor = colors[particle];
     vec2 pPos = pPosSize.xy;
     float pSize = pPosSize.z;
     // 1. Set gl_Position, texCoord and color
@@ -0,0 +1,90 @@
+import math
+
+import numpy
+
+# particles closer than this push each other apart, it is also the grid cell size
+INTERACTION_RADIUS = 0.02
+INTERACTION_STIFFNESS = 2.0
+# the grid covers [-GRID_EXTENT, GRID_EXTENT] on both axes, particles outside of it are put in the border cells
+GRID_EXTENT = 1.0
+
+# NumPy reference of the compute shader grid, slow but exact enough to validate the GPU results against
+
+
+def grid_dims(radius=INTERACTION_RADIUS, extent=GRID_EXTENT):
+    return math.ceil(2 * extent / radius)
+
+
+def cell_coordinates(positions, radius=INTERACTION_RADIUS, extent=GRID_EXTENT):
+    # the clamping keeps neighbours within one cell of each other, so the 3x3 cells around a particle still hold
+    # every particle closer than the radius
+    dims = grid_dims(radius, extent)
+    # multiplied by the inverse in float32 like on the GPU, where a division is not correctly rounded
+    scaled = (positions[:, :2] + numpy.float32(extent)) * numpy.float32(1 / radius)
+    coordinates = numpy.floor(scaled).astype(numpy.int64)
+    return numpy.clip(coordinates, 0, dims - 1)
+
+
+def build_grid(positions, radius=INTERACTION_RADIUS, extent=GRID_EXTENT):
+    # counting sort of the particles by cell: cell of every particle, particle indices sorted by cell,
+    # and for every cell the range of sorted_indices holding its particles
+    dims = grid_dims(radius, extent)
+    coordinates = cell_coordinates(positions, radius, extent)
+    cells = coordinates[:, 1] * dims + coordinates[:, 0]
+    counts = numpy.bincount(cells, minlength=dims * dims)
+    cell_end = numpy.cumsum(counts)
+    cell_start = cell_end - counts
+    sorted_indices = numpy.argsort(cells, kind="stable")
+    return cells, sorted_indices, cell_start, cell_end
+
+
+def pair_forces(positions, i, j, radius):
+    d = positions[i, :2] - positions[j, :2]
+    distance = numpy.sqrt((d ** 2).sum(axis=1))
+    # coincident particles have no direction to push each other in
+    close = (distance < radius) & (distance > 0) & (i != j)
+    d, distance, i = d[close], distance[close], i[close]
+    force = d / distance[:, None] * (1 - distance / radius)[:, None]
+    total = numpy.zeros((len(positions), 2))
+    numpy.add.at(total, i, force)
+    return total
+
+
+def grid_forces(positions, radius=INTERACTION_RADIUS, extent=GRID_EXTENT):
+    # every particle against the particles of the 3x3 cells around it
+    dims = grid_dims(radius, extent)
+    _, sorted_indices, cell_start, cell_end = build_grid(positions, radius, extent)
+    coordinates = cell_coordinates(positions, radius, extent)
+    total = numpy.zeros((len(positions), 2))
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            x = coordinates[:, 0] + dx
+            y = coordinates[:, 1] + dy
+            inside = numpy.flatnonzero((x >= 0) & (x < dims) & (y >= 0) & (y < dims))
+            cells = y[inside] * dims + x[inside]
+            lengths = cell_end[cells] - cell_start[cells]
+            # one (particle, candidate) pair per particle of the neighbouring cell
+            i = numpy.repeat(inside, lengths)
+            ramp = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+            j = sorted_indices[numpy.repeat(cell_start[cells], lengths) + ramp]
+            total += pair_forces(positions, i, j, radius)
+    return total
+
+
+def brute_force_forces(positions, radius=INTERACTION_RADIUS, chunk=512):
+    # all pairs, in chunks of rows to bound the memory
+    total = numpy.zeros((len(positions), 2))
+    for first in range(0, len(positions), chunk):
+        rows = numpy.arange(first, min(first + chunk, len(positions)))
+        i = numpy.repeat(rows, len(positions))
+        j = numpy.tile(numpy.arange(len(positions)), len(rows))
+        total += pair_forces(positions, i, j, radius)
+    return total
+
+
+def interact(positions, parameters, delta_time, radius=INTERACTION_RADIUS, extent=GRID_EXTENT,
+             stiffness=INTERACTION_STIFFNESS):
+    # velocities after one step, as grid_interact.comp computes them
+    result = parameters.copy()
+    result[:, :2] += (grid_forces(positions, radius, extent) * stiffness * delta_time).astype(numpy.float32)
+    return result
@@ -0,0 +1,81 @@
+import sys
+import time
+
+import glfw
+import numpy
+from OpenGL.GL import *
+
+from compute_template import SpatialGrid, init_glfw, upload_buffer
+from spatial_grid import GRID_EXTENT, brute_force_forces, build_grid, grid_forces, interact
+
+# small enough for the brute force reference
+REFERENCE_COUNT = 5000
+GPU_COUNT = 200000
+DELTA_TIME = 1 / 60
+
+
+def random_particles(count, rng):
+    # a bit beyond the grid, so that the border cells are tested as well
+    positions = numpy.zeros((count, 4), numpy.float32)
+    positions[:, :2] = rng.uniform(-1.1 * GRID_EXTENT, 1.1 * GRID_EXTENT, (count, 2))
+    parameters = rng.random((count, 4), numpy.float32)
+    return positions, parameters
+
+
+def validate_reference(rng):
+    # the grid visits the same pairs as the all pairs loop
+    positions, _ = random_particles(REFERENCE_COUNT, rng)
+    assert numpy.allclose(grid_forces(positions), brute_force_forces(positions), atol=1e-9)
+    print(f"NumPy grid matches the brute force forces for {REFERENCE_COUNT} particles")
+
+
+def validate_gpu(rng):
+    window = init_glfw(64, 64, "Spatial grid validation")
+    glfw.hide_window(window)
+
+    positions, parameters = random_particles(GPU_COUNT, rng)
+    buffers = {}
+    for binding, data in ((0, positions), (1, parameters)):
+        buffers[binding] = glGenBuffers(1)
+        glBindBuffer(GL_SHADER_STORAGE_BUFFER, buffers[binding])
+        upload_buffer(GL_SHADER_STORAGE_BUFFER, data, GL_DYNAMIC_COPY)
+        glBindBufferBase(GL_SHADER_STORAGE_BUFFER, binding, buffers[binding])
+
+    grid = SpatialGrid(GPU_COUNT)
+    glFinish()
+    start = time.perf_counter()
+    grid.update(DELTA_TIME)
+    glFinish()
+    gpu_time = time.perf_counter() - start
+
+    cells, sorted_indices, cell_start, cell_end = grid.read_grid()
+    expected_cells, expected_indices, expected_start, expected_end = build_grid(positions)
+    assert numpy.array_equal(cells, expected_cells)
+    assert numpy.array_equal(cell_start, expected_start) and numpy.array_equal(cell_end, expected_end)
+    # the order within a cell is up to the GPU, each cell has to hold the same particles
+    assert numpy.array_equal(numpy.sort(sorted_indices), numpy.arange(GPU_COUNT))
+    assert numpy.array_equal(cells[sorted_indices], expected_cells[expected_indices])
+
+    result = numpy.empty_like(parameters)
+    glBindBuffer(GL_SHADER_STORAGE_BUFFER, buffers[1])
+    glGetBufferSubData(GL_SHADER_STORAGE_BUFFER, 0, result.nbytes, result)
+    start = time.perf_counter()
+    expected = interact(positions, parameters, DELTA_TIME)
+    reference_time = time.perf_counter() - start
+    assert numpy.allclose(result, expected, rtol=1e-4, atol=1e-5)
+
+    print(f"GPU grid matches the NumPy reference for {GPU_COUNT} particles, "
+          f"{gpu_time * 1000:.2f} ms on the GPU, {reference_time * 1000:.0f} ms in NumPy")
+    glfw.terminate()
+
+
+def main():
+    # --gpu compares the compute shaders against the reference, without it no window or OpenGL context is created
+    rng = numpy.random.default_rng(0)
+    validate_reference(rng)
+    if "--gpu" in sys.argv[1:]:
+        validate_gpu(rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import sys
+import time
+
+import numpy
+import pygame
+from OpenGL.GL import *
+
+from final import draw_image, init_display, render_circle, render_rgb
+from texture_stream import TextureStream, buffer_storage_supported
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080), (2560, 1440), (3840, 2160)]
+FRAMES = 120
+
+
+def create_target(width, height):
+    # the window is hidden and small, frames are drawn into an offscreen framebuffer of the measured size instead,
+    # so no pixels are clipped away
+    framebuffer_id = glGenFramebuffers(1)
+    renderbuffer_id = glGenRenderbuffers(1)
+    glBindRenderbuffer(GL_RENDERBUFFER, renderbuffer_id)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+    glBindFramebuffer(GL_FRAMEBUFFER, framebuffer_id)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, renderbuffer_id)
+    glViewport(0, 0, width, height)
+    return framebuffer_id, renderbuffer_id
+
+
+def delete_target(target):
+    framebuffer_id, renderbuffer_id = target
+    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+    glDeleteFramebuffers(1, [framebuffer_id])
+    glDeleteRenderbuffers(1, [renderbuffer_id])
+
+
+def measure(present, images):
+    # every frame gets a different image than the previous one, like while the parameters change
+    present(images[0])
+    glFinish()
+    call_times = []
+    start = time.perf_counter()
+    for i in range(FRAMES):
+        call_start = time.perf_counter()
+        present(images[i % len(images)])
+        call_times.append(time.perf_counter() - call_start)
+        glFlush()
+    glFinish()
+    return (time.perf_counter() - start) / FRAMES, numpy.mean(call_times)
+
+
+def bench_draw_pixels(images):
+    return measure(draw_image, images)
+
+
+def bench_texture_stream(images, persistent):
+    height, width = images[0].shape[:2]
+    stream = TextureStream(width, height, persistent=persistent)
+
+    def present(image):
+        stream.upload(image)
+        stream.draw()
+
+    result = measure(present, images)
+    stream.delete()
+    return result
+
+
+def run(name, legacy, bench, *args):
+    # each path gets a context of its own kind, glDrawPixels is not available in the core profile
+    pygame.display.init()
+    init_display(64, 64, legacy, pygame.HIDDEN)
+    if bench is bench_texture_stream and args[0] and not buffer_storage_supported():
+        print(f"{name:24} glBufferStorage needs OpenGL 4.4, skipped")
+        pygame.display.quit()
+        return
+    for width, height in resolutions():
+        images = [render_rgb(width, height), render_circle(width, height, 0.01, 0.05)]
+        target = create_target(width, height)
+        frame_time, call_time = bench(images, *args)
+        delete_target(target)
+        bandwidth = images[0].nbytes / frame_time / 2 ** 30
+        print(f"{name:24} {width:5}x{height:<5} frame {frame_time * 1000:8.2f} ms   call {call_time * 1000:8.2f} ms"
+              f"   {bandwidth:6.2f} GiB/s")
+    pygame.display.quit()
+
+
+def resolutions():
+    if len(sys.argv) > 2:
+        return [(int(sys.argv[1]), int(sys.argv[2]))]
+    return RESOLUTIONS
+
+
+def main():
+    run("glDrawPixels", True, bench_draw_pixels)
+    run("PBO, orphaned", False, bench_texture_stream, False)
+    run("PBO, persistently mapped", False, bench_texture_stream, True)
+
+
+if __name__ == "__main__":
+    main()
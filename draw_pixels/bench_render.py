@@ -0,0 +1,93 @@
+import math
+import sys
+import time
+
+from final import render_circle, render_rgb
+
+
+def image_to_buffer(image):
+    height = len(image)
+    width = len(image[0])
+    buffer = bytearray(width * height * 3)
+    for row in range(height):
+        for col in range(width):
+            for comp in range(3):
+                buffer[row * width * 3 + col * 3 + comp] = image[row][col][comp]
+    return buffer
+
+
+def create_image(width, height):
+    return [[(0, 0, 0) for _ in range(width)] for _ in range(height)]
+
+
+# the previous per-pixel implementations, including the copy into the buffer handed to glDrawPixels
+def legacy_render_circle(width, height, w, s):
+    image = create_image(width, height)
+
+    for row in range(height):
+        for col in range(width):
+            x = col * 2 / width - 1
+            y = row * 2 / height - 1
+
+            d = abs(x ** 2 + y ** 2 - 0.5 ** 2)
+            if d <= w:
+                color = 255
+            elif d <= w + s:
+                color = int(255 - 255 * (d - w) / s)
+            else:
+                color = 0
+
+            image[row][col] = (color, color, color)
+
+    return image_to_buffer(image)
+
+
+def legacy_render_rgb(width, height):
+    image = create_image(width, height)
+
+    for row in range(height):
+        for col in range(width):
+            x = col * 2 / width - 1
+            y = row * 2 / height - 1
+
+            d1 = x ** 2 + (y - math.sqrt(2) / 3) ** 2
+            red = max(0, int(255 - 255 * d1 / 0.6))
+
+            d2 = (x - 0.5) ** 2 + (y + 1 / math.sqrt(2) / 3) ** 2
+            green = max(0, int(255 - 255 * d2 / 0.6))
+
+            d3 = (x + 0.5) ** 2 + (y + 1 / math.sqrt(2) / 3) ** 2
+            blue = max(0, int(255 - 255 * d3 / 0.6))
+
+            image[row][col] = (red, green, blue)
+
+    return image_to_buffer(image)
+
+
+def measure(function, *args, repeats=1):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 800
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else width
+
+    cases = [("draw_rgb", legacy_render_rgb, render_rgb, ())]
+    cases += [(f"draw_circle w={w} s={s}", legacy_render_circle, render_circle, (w, s))
+              for w, s in ((0.005, 0), (0.01, 0.005), (0.05, 0.1))]
+
+    for name, legacy, vectorized, params in cases:
+        legacy_time, legacy_buffer = measure(legacy, width, height, *params)
+        new_time, image = measure(vectorized, width, height, *params, repeats=5)
+        assert image.shape == (height, width, 3) and image.tobytes() == bytes(legacy_buffer), name
+        print(f"{name:30} {width}x{height}  loops: {legacy_time * 1000:9.1f} ms   numpy: {new_time * 1000:7.2f} ms"
+              f"   {legacy_time / new_time:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
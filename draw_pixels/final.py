@@ -1,101 +1,175 @@
 import math
 
+import numpy
 import pygame
 
 from OpenGL.GL import *
 
+from frame_cache import FrameCache
+from texture_stream import TextureStream
+from tiled_renderer import TiledRenderer
 
-def image_to_buffer(image):
-    height = len(image)
-    width = len(image[0])
-    buffer = bytearray(width * height * 3)
-    for row in range(height):
-        for col in range(width):
-            for comp in range(3):
-                buffer[row * width * 3 + col * 3 + comp] = image[row][col][comp]
-    return buffer
+# show the circle controlled by the arrow keys instead of the rgb image
+DRAW_CIRCLE = False
+# show frames with glDrawPixels in a compatibility context instead of streaming them into a texture
+USE_DRAW_PIXELS = False
+# change of w and s per key press
+STEP = 0.005
+# the E key renders the current image at this size on all cores and saves it
+EXPORT_SIZE = (3840, 2160)
+EXPORT_FILENAME = "export.png"
 
 
-def create_image(width, height):
-    return [[(0, 0, 0) for _ in range(width)] for _ in range(height)]
+def normalized_coordinates(width, height, rows=None):
+    # x as a (1, width) row and y as a (height, 1) column in [-1, 1), computed exactly as col * 2 / width - 1 and
+    # row * 2 / height - 1, broadcasting them gives every pixel; rows = (start, end) limits them to a band of the image
+    row_indices = numpy.arange(*rows) if rows is not None else numpy.arange(height)
+    return numpy.meshgrid(numpy.arange(width) * 2 / width - 1, row_indices * 2 / height - 1, sparse=True)
 
 
-def draw_circle(width, height, w, s):
-    image = create_image(width, height)
+def render_circle(width, height, w, s, rows=None):
+    x, y = normalized_coordinates(width, height, rows)
 
-    for row in range(height):
-        for col in range(width):
-            x = col * 2 / width - 1
-            y = row * 2 / height - 1
+    d = numpy.abs(x ** 2 + y ** 2 - 0.5 ** 2)
+    color = numpy.zeros(d.shape, numpy.uint8)
+    edge = (d > w) & (d <= w + s)
+    # the edge is empty when s is 0, so there is no division by zero
+    color[edge] = numpy.trunc(255 - 255 * (d[edge] - w) / s)
+    color[d <= w] = 255
 
-            d = abs(x ** 2 + y ** 2 - 0.5 ** 2)
-            if d <= w:
-                color = 255
-            elif d <= w + s:
-                color = int(255 - 255 * (d - w) / s)
-            else:
-                color = 0
+    return numpy.repeat(color[:, :, None], 3, axis=2)
 
-            image[row][col] = (color, color, color)
 
-    buffer = image_to_buffer(image)
-    glDrawPixels(width, height, GL_RGB, GL_UNSIGNED_BYTE, buffer)
+def falloff(d):
+    # max(0, int(...)): truncation towards zero, negative values end up as 0
+    return numpy.maximum(0, numpy.trunc(255 - 255 * d / 0.6)).astype(numpy.uint8)
 
 
-def draw_rgb(width, height):
-    image = create_image(width, height)
+def render_rgb(width, height, rows=None):
+    x, y = normalized_coordinates(width, height, rows)
+
+    d1 = x ** 2 + (y - math.sqrt(2) / 3) ** 2
+    d2 = (x - 0.5) ** 2 + (y + 1 / math.sqrt(2) / 3) ** 2
+    d3 = (x + 0.5) ** 2 + (y + 1 / math.sqrt(2) / 3) ** 2
+
+    return numpy.stack([falloff(d1), falloff(d2), falloff(d3)], axis=2)
 
-    for row in range(height):
-        for col in range(width):
-            x = col * 2 / width - 1
-            y = row * 2 / height - 1
 
-            d1 = x ** 2 + (y - math.sqrt(2) / 3) ** 2
-            red = max(0, int(255 - 255 * d1 / 0.6))
+def draw_image(image):
+    height, width = image.shape[:2]
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glDrawPixels(width, height, GL_RGB, GL_UNSIGNED_BYTE, image)
 
-            d2 = (x - 0.5) ** 2 + (y + 1 / math.sqrt(2) / 3) ** 2
-            green = max(0, int(255 - 255 * d2 / 0.6))
 
-            d3 = (x + 0.5) ** 2 + (y + 1 / math.sqrt(2) / 3) ** 2
-            blue = max(0, int(255 - 255 * d3 / 0.6))
+def save_image(image, filename):
+    # the rows of the image go bottom-up, as glDrawPixels expects them
+    height, width = image.shape[:2]
+    pygame.image.save(pygame.image.frombuffer(numpy.ascontiguousarray(image[::-1]), (width, height), "RGB"), filename)
 
-            image[row][col] = (red, green, blue)
 
-    buffer = image_to_buffer(image)
-    glDrawPixels(width, height, GL_RGB, GL_UNSIGNED_BYTE, buffer)
+def report_export(job):
+    band_times = [elapsed for _, elapsed in job.band_times()]
+    print(f"Exported {EXPORT_FILENAME} in {job.elapsed * 1000:.0f} ms, {len(band_times)} bands, "
+          f"{min(band_times) * 1000:.1f} / {numpy.mean(band_times) * 1000:.1f} / {max(band_times) * 1000:.1f} ms "
+          f"min / mean / max per band")
+
+
+def draw_circle(width, height, w, s):
+    draw_image(render_circle(width, height, w, s))
+
+
+def draw_rgb(width, height):
+    draw_image(render_rgb(width, height))
+
+
+def init_display(width, height, legacy=False, flags=0):
+    # glDrawPixels only exists in compatibility contexts, the texture stream uses the same core context as the lessons
+    if legacy:
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 2)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 1)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_PROFILE_MASK, pygame.GL_CONTEXT_PROFILE_COMPATIBILITY)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_FLAGS, 0)
+    else:
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MAJOR_VERSION, 4)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_MINOR_VERSION, 1)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_PROFILE_MASK, pygame.GL_CONTEXT_PROFILE_CORE)
+        pygame.display.gl_set_attribute(pygame.GL_CONTEXT_FLAGS, pygame.GL_CONTEXT_FORWARD_COMPATIBLE_FLAG)
+    pygame.display.set_mode((width, height), pygame.DOUBLEBUF | pygame.OPENGL | flags)
 
 
 def main():
     pygame.init()
     width = 800
     height = 800
-    pygame.display.set_mode((width, height), pygame.DOUBLEBUF | pygame.OPENGL)
-
-    w = 0.005
-    s = 0
+    init_display(width, height, USE_DRAW_PIXELS)
+    stream = None if USE_DRAW_PIXELS else TextureStream(width, height)
+    shown_image = None
+
+    # w and s are kept as step counts so that the same values always produce the same cache keys
+    w_steps = 1
+    s_steps = 0
+    cache = FrameCache()
+    # the worker processes are only started by the first export
+    renderer = None
+    export_job = None
 
     while True:
+        previous_steps = (w_steps, s_steps)
+        export_requested = False
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                # the shared framebuffers outlive the process unless they are unlinked
+                if renderer is not None:
+                    renderer.close()
+                if stream is not None:
+                    stream.delete()
                 pygame.quit()
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     pygame.event.post(pygame.event.Event(pygame.QUIT))
                 if event.key == pygame.K_LEFT:
-                    w = max(0.005, w - 0.005)
+                    w_steps = max(1, w_steps - 1)
                 if event.key == pygame.K_RIGHT:
-                    w += 0.005
+                    w_steps += 1
                 if event.key == pygame.K_DOWN:
-                    s = max(0, s - 0.005)
+                    s_steps = max(0, s_steps - 1)
                 if event.key == pygame.K_UP:
-                    s += 0.005
+                    s_steps += 1
+                if event.key == pygame.K_e:
+                    export_requested = True
+
+        render, params = (render_circle, (w_steps * STEP, s_steps * STEP)) if DRAW_CIRCLE else (render_rgb, ())
+
+        # an export still rendering with the old parameters is cancelled and started over
+        if export_requested or export_job is not None and (w_steps, s_steps) != previous_steps:
+            renderer = renderer or TiledRenderer()
+            export_job = renderer.start(render, *EXPORT_SIZE, *params)
+        if export_job is not None and export_job.done():
+            save_image(export_job.result(), EXPORT_FILENAME)
+            report_export(export_job)
+            export_job = None
+
+        # frames are only rendered when a parameter changes, the next key press is usually prefetched already
+        image = cache.get(render, width, height, *params)
+        if DRAW_CIRCLE:
+            for next_w_steps, next_s_steps in ((max(1, w_steps - 1), s_steps), (w_steps + 1, s_steps),
+                                               (w_steps, max(0, s_steps - 1)), (w_steps, s_steps + 1)):
+                cache.prefetch(render_circle, width, height, next_w_steps * STEP, next_s_steps * STEP)
 
         glClear(GL_COLOR_BUFFER_BIT)
 
-        draw_rgb(width, height)
+        if stream is None:
+            draw_image(image)
+        else:
+            # the texture keeps the last frame, it is only uploaded again when the image changes
+            if image is not shown_image:
+                stream.upload(image)
+                shown_image = image
+            stream.draw()
 
         pygame.display.flip()
         pygame.time.wait(10)
 
 
-main()
+if __name__ == "__main__":
+    main()
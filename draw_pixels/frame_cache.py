@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BUDGET = 64 * 2 ** 20
+
+
+class FrameCache:
+    # finished images keyed by (render function, width, height, params), least recently used dropped past the budget;
+    # neighbouring parameters can be rendered ahead of time on a background thread, NumPy releases the GIL meanwhile
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.frames = OrderedDict()
+        self.size = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(1)
+        self.hits = 0
+        self.misses = 0
+        self.prefetch_hits = 0
+
+    def get(self, render, width, height, *params):
+        key = (render, width, height, params)
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            future = self.pending.get(key)
+
+        if future is not None:
+            # already being rendered in the background, waiting is never slower than starting over
+            self.prefetch_hits += 1
+            return future.result()
+
+        self.misses += 1
+        frame = render(width, height, *params)
+        self.store(key, frame)
+        return frame
+
+    def prefetch(self, render, width, height, *params):
+        key = (render, width, height, params)
+        with self.lock:
+            if key in self.frames or key in self.pending:
+                return
+            self.pending[key] = self.executor.submit(self.render_pending, key)
+
+    def render_pending(self, key):
+        render, width, height, params = key
+        frame = render(width, height, *params)
+        self.store(key, frame)
+        with self.lock:
+            del self.pending[key]
+        return frame
+
+    def store(self, key, frame):
+        with self.lock:
+            if key in self.frames:
+                return
+            self.frames[key] = frame
+            self.size += frame.nbytes
+            # the newest frame stays even if it alone is over the budget
+            while self.size > self.budget and len(self.frames) > 1:
+                _, evicted = self.frames.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,12 @@
+#version 410
+
+in vec2 texCoord;
+
+uniform sampler2D frame;
+
+out vec4 fragColor;
+
+void main()
+{
+    fragColor = texture(frame, texCoord);
+}
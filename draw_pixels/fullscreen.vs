@@ -0,0 +1,11 @@
+#version 410
+
+out vec2 texCoord;
+
+void main()
+{
+    // one triangle covering the screen, generated from the vertex index without any vertex buffer
+    vec2 corner = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2);
+    gl_Position = vec4(corner * 2.0 - 1.0, 0.0, 1.0);
+    texCoord = corner;
+}
@@ -0,0 +1,140 @@
+import ctypes
+import time
+
+import numpy
+from OpenGL.GL import *
+from OpenGL.GL.shaders import compileProgram, compileShader
+
+STREAM_BUFFERS = 2
+PERSISTENT_FLAGS = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+FENCE_TIMEOUT = 10 ** 9
+
+
+def read_shader_file(filename):
+    with open(filename) as file:
+        return "".join(file.readlines())
+
+
+def build_shader(shader_name):
+    try:
+        return compileProgram(
+            compileShader(read_shader_file(f"{shader_name}.vs"), GL_VERTEX_SHADER),
+            compileShader(read_shader_file(f"{shader_name}.fs"), GL_FRAGMENT_SHADER)
+        )
+    except RuntimeError as e:
+        print(str(e.args[0]).replace("b\"", "\n").replace("\\n", "\n"))
+        exit(0)
+
+
+def buffer_storage_supported():
+    # glBufferStorage is core since 4.4, macOS stops at 4.1
+    return (glGetIntegerv(GL_MAJOR_VERSION), glGetIntegerv(GL_MINOR_VERSION)) >= (4, 4)
+
+
+class TextureStream:
+    # frames are copied into one of several pixel unpack buffers and the texture is updated from it,
+    # so glTexSubImage2D returns at once and the GPU copies the pixels while the next frame is prepared;
+    # with GL 4.4 the buffers are regions of one persistently mapped buffer, otherwise they are orphaned every frame
+    def __init__(self, width, height, buffers=STREAM_BUFFERS, persistent=None):
+        self.width = width
+        self.height = height
+        self.frame_size = width * height * 3
+        self.persistent = buffer_storage_supported() if persistent is None else persistent
+        self.fences = [None] * buffers
+        self.next = 0
+        self.uploaded_bytes = 0
+        self.wait_time = 0
+
+        self.shader_program = build_shader("fullscreen")
+        # the triangle is generated in the vertex shader, but core profiles still need a vertex array bound
+        self.array_id = glGenVertexArrays(1)
+
+        self.tex_id = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.tex_id)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB8, width, height, 0, GL_RGB, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        if self.persistent:
+            self.buffer_ids = [glGenBuffers(1)]
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffer_ids[0])
+            glBufferStorage(GL_PIXEL_UNPACK_BUFFER, buffers * self.frame_size, None, PERSISTENT_FLAGS)
+            pointer = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, buffers * self.frame_size, PERSISTENT_FLAGS)
+            address = ctypes.cast(pointer, ctypes.c_void_p).value
+            # stays mapped for the lifetime of the stream, frames are written straight into these views
+            mapped = numpy.ctypeslib.as_array((ctypes.c_uint8 * (buffers * self.frame_size)).from_address(address))
+            self.regions = mapped.reshape(buffers, height, width, 3)
+        else:
+            self.buffer_ids = list(glGenBuffers(buffers)) if buffers > 1 else [glGenBuffers(1)]
+            self.regions = None
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+    def wait(self, index):
+        # the GPU may still be copying an earlier frame out of this buffer
+        fence = self.fences[index]
+        if fence is None:
+            return
+        start = time.perf_counter()
+        glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, FENCE_TIMEOUT)
+        self.wait_time += time.perf_counter() - start
+        glDeleteSync(fence)
+        self.fences[index] = None
+
+    def upload(self, image):
+        # image rows go bottom-up, like for glDrawPixels
+        if image.shape != (self.height, self.width, 3):
+            raise ValueError(f"Expected a {self.width}x{self.height} RGB image, got shape {image.shape}")
+        index = self.next
+        self.next = (self.next + 1) % len(self.fences)
+
+        if self.persistent:
+            self.wait(index)
+            self.regions[index] = image
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffer_ids[0])
+            offset = index * self.frame_size
+        else:
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffer_ids[index])
+            # respecifying the storage lets the driver hand out fresh memory instead of waiting for the old frame
+            glBufferData(GL_PIXEL_UNPACK_BUFFER, self.frame_size, None, GL_STREAM_DRAW)
+            glBufferSubData(GL_PIXEL_UNPACK_BUFFER, 0, self.frame_size, numpy.ascontiguousarray(image))
+            offset = 0
+
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glBindTexture(GL_TEXTURE_2D, self.tex_id)
+        glTexSubImage2D(GL_TEXTURE_2D, 0, 0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE,
+                        ctypes.c_void_p(offset))
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+        if self.persistent:
+            self.fences[index] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.uploaded_bytes += self.frame_size
+
+    def draw(self):
+        glUseProgram(self.shader_program)
+        glActiveTexture(GL_TEXTURE0)
+        glBindTexture(GL_TEXTURE_2D, self.tex_id)
+        glUniform1i(glGetUniformLocation(self.shader_program, "frame"), 0)
+        glBindVertexArray(self.array_id)
+        glDrawArrays(GL_TRIANGLES, 0, 3)
+        glBindVertexArray(0)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glUseProgram(0)
+
+    def delete(self):
+        for fence in self.fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        self.fences = [None] * len(self.fences)
+        if self.persistent:
+            self.regions = None
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffer_ids[0])
+            glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+            glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+        glDeleteBuffers(len(self.buffer_ids), self.buffer_ids)
+        glDeleteTextures(1, [self.tex_id])
+        glDeleteVertexArrays(1, [self.array_id])
+        glDeleteProgram(self.shader_program)
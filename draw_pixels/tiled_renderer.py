@@ -0,0 +1,127 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy
+
+# rows per band, small enough that a cancelled render stops soon and the bands balance between the workers
+BAND_ROWS = 64
+
+# set in every worker process by init_worker
+current_generation = None
+
+
+def release_shared_memory(shm):
+    # images handed out earlier may still be views of the buffer, the mapping then goes away with the last of them
+    try:
+        shm.close()
+    except BufferError:
+        pass
+    shm.unlink()
+
+
+def init_worker(generation):
+    global current_generation
+    current_generation = generation
+
+
+def render_band(shm_name, width, height, render, params, rows, generation):
+    # runs in a worker process, writes its rows straight into the shared framebuffer
+    if current_generation.value != generation:
+        return None
+    start = time.perf_counter()
+    shm = shared_memory.SharedMemory(shm_name)
+    try:
+        framebuffer = numpy.ndarray((height, width, 3), numpy.uint8, shm.buf)
+        framebuffer[rows[0]:rows[1]] = render(width, height, *params, rows=rows)
+        del framebuffer
+    finally:
+        shm.close()
+    return rows, time.perf_counter() - start
+
+
+class RenderJob:
+    def __init__(self, renderer, framebuffer, generation, futures):
+        self.renderer = renderer
+        self.framebuffer = framebuffer
+        self.generation = generation
+        self.futures = futures
+        self.start_time = time.perf_counter()
+        self.elapsed = None
+
+    @property
+    def cancelled(self):
+        return self.renderer.generation.value != self.generation
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+    def result(self):
+        # the image is a view of the shared framebuffer, valid until the renderer reuses it two jobs later
+        for future in self.futures:
+            if not future.cancelled():
+                future.result()
+        if self.elapsed is None:
+            self.elapsed = time.perf_counter() - self.start_time
+        return None if self.cancelled else self.framebuffer
+
+    def cancel(self):
+        # bands that have not started are dropped, running ones finish their rows
+        with self.renderer.generation.get_lock():
+            if self.renderer.generation.value == self.generation:
+                self.renderer.generation.value += 1
+        for future in self.futures:
+            future.cancel()
+
+    def band_times(self):
+        return [future.result() for future in self.futures
+                if future.done() and not future.cancelled() and future.result() is not None]
+
+
+class TiledRenderer:
+    # renders row bands of an image on a process pool into one of two shared memory framebuffers,
+    # so the previous finished image stays intact while the next one is rendered
+    def __init__(self, workers=None, band_rows=BAND_ROWS):
+        self.band_rows = band_rows
+        self.generation = multiprocessing.Value("q", 0)
+        self.executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(self.generation,))
+        self.buffers = [None, None]
+        self.next_buffer = 0
+        self.job = None
+
+    def framebuffer(self, width, height):
+        shm = self.buffers[self.next_buffer]
+        if shm is None or shm.size < width * height * 3:
+            if shm is not None:
+                release_shared_memory(shm)
+            shm = shared_memory.SharedMemory(create=True, size=width * height * 3)
+            self.buffers[self.next_buffer] = shm
+        self.next_buffer = 1 - self.next_buffer
+        return shm
+
+    def start(self, render, width, height, *params):
+        # a render that is still running is cancelled, its parameters are out of date
+        if self.job is not None and not self.job.done():
+            self.job.cancel()
+        generation = self.generation.value
+        shm = self.framebuffer(width, height)
+        futures = [self.executor.submit(render_band, shm.name, width, height, render, params,
+                                        (row, min(row + self.band_rows, height)), generation)
+                   for row in range(0, height, self.band_rows)]
+        image = numpy.ndarray((height, width, 3), numpy.uint8, shm.buf)
+        self.job = RenderJob(self, image, generation, futures)
+        return self.job
+
+    def render(self, render, width, height, *params):
+        return self.start(render, width, height, *params).result()
+
+    def close(self):
+        if self.job is not None:
+            self.job.cancel()
+        self.executor.shutdown()
+        self.job = None
+        for shm in self.buffers:
+            if shm is not None:
+                release_shared_memory(shm)
+        self.buffers = [None, None]
@@ -2,6 +2,7 @@ import time
 from ctypes import sizeof, c_void_p
 
 import glfw
+import numpy
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 
@@ -30,11 +31,24 @@ def init_glfw():
     return window
 
 
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    glBufferData(target, data.nbytes, data, usage)
+
+
 def bind_vertices(vertices):
-    vertices = (GLfloat * len(vertices))(*vertices)
     glBindVertexArray(glGenVertexArrays(1))
     glBindBuffer(GL_ARRAY_BUFFER, glGenBuffers(1))
-    glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), vertices, GL_STATIC_DRAW)
+    upload_buffer(GL_ARRAY_BUFFER, vertices)
     glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), c_void_p(0))
     glEnableVertexAttribArray(0)
 
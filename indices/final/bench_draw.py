@@ -0,0 +1,67 @@
+import sys
+import time
+
+import glfw
+from OpenGL.GL import *
+
+from indices_final import Mesh, build_cone, build_cube, build_cylinder, build_sphere, init_glfw
+
+
+class ClientIndexMesh(Mesh):
+    # the previous behaviour: indices are passed from client memory with every draw call
+    def bind_attributes(self):
+        super().bind_attributes()
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        glBindVertexArray(self.vertex_array_id)
+        glDrawElements(GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, self.indices)
+
+
+def build_meshes(mesh_class):
+    meshes = [build_cube(), build_sphere(30, 30), build_cylinder(30, 2, 1), build_cone(100, 2, 1),
+              build_sphere(300, 300)]
+    for i, mesh in enumerate(meshes):
+        meshes[i] = mesh_class(mesh.vertices, mesh.indices, mesh.attributes)
+        meshes[i].bind_attributes()
+    return meshes
+
+
+def measure_frames(meshes, frames):
+    # CPU time spent issuing the draw calls of a frame, the GPU work is waited for outside of the measurement
+    total = 0
+    for _ in range(frames):
+        start = time.perf_counter()
+        for mesh in meshes:
+            mesh.draw()
+        total += time.perf_counter() - start
+        glFinish()
+    return total / frames
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    init_glfw(640, 480, "Draw benchmark")
+
+    meshes = build_meshes(Mesh)
+    client_meshes = build_meshes(ClientIndexMesh)
+    for mesh in meshes:
+        index_width = 16 if mesh.index_type == GL_UNSIGNED_SHORT else 32
+        print(f"{len(mesh.vertices) // sum(mesh.attributes):6} vertices, {len(mesh.indices):7} indices, "
+              f"{index_width}-bit")
+
+    measure_frames(meshes, 10)
+    measure_frames(client_meshes, 10)
+
+    buffer_time = measure_frames(meshes, frames)
+    client_time = measure_frames(client_meshes, frames)
+    print(f"client-side indices:  {client_time * 1000:8.3f} ms per frame")
+    print(f"element buffers:      {buffer_time * 1000:8.3f} ms per frame")
+    print(f"saved:                {(client_time - buffer_time) * 1000:8.3f} ms per frame")
+
+    glfw.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ from ctypes import sizeof, c_void_p
 
 import glfw
 import glm
+import numpy
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 
@@ -113,19 +114,44 @@ def resize(width, height, shader_program):
         glViewport(0, 0, width, height)
 
 
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    glBufferData(target, data.nbytes, data, usage)
+
+
+def index_type_for(vertex_count):
+    if vertex_count < 1 << 16:
+        return GL_UNSIGNED_SHORT, numpy.uint16
+    return GL_UNSIGNED_INT, numpy.uint32
+
+
 class Mesh:
     def __init__(self, vertices, indices, attributes):
         self.vertices = vertices
         self.indices = indices
         self.attributes = attributes
         self.vertex_array_id = None
+        self.index_type = None
 
     def bind_attributes(self):
-        vertices = (GLfloat * len(self.vertices))(*self.vertices)
         self.vertex_array_id = glGenVertexArrays(1)
         glBindVertexArray(self.vertex_array_id)
         glBindBuffer(GL_ARRAY_BUFFER, glGenBuffers(1))
-        glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), vertices, GL_STATIC_DRAW)
+        upload_buffer(GL_ARRAY_BUFFER, self.vertices)
+
+        # the element buffer binding is part of the vertex array state, so the indices are uploaded only once
+        self.index_type, index_dtype = index_type_for(len(self.vertices) // sum(self.attributes))
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, glGenBuffers(1))
+        upload_buffer(GL_ELEMENT_ARRAY_BUFFER, self.indices, dtype=index_dtype)
 
         vertex_size = sum(self.attributes)
         offset = 0
@@ -138,7 +164,7 @@ class Mesh:
 
     def draw(self):
         glBindVertexArray(self.vertex_array_id)
-        glDrawElements(GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, self.indices)
+        glDrawElements(GL_TRIANGLES, len(self.indices), self.index_type, None)
 
 
 def build_cube():
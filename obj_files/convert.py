@@ -1,54 +1,167 @@
-def convert(input_filename, output_filename):
-    v = []
-    vn = []
-    vt = []
-    f = []
-
-    with open(input_filename) as file:
-        for line in file.readlines():
-            tokens = line.split()
-            if len(tokens) == 0:
-                continue
-            if tokens[0] == "v":
-                v.append(list(map(float, tokens[1:])))
-            elif tokens[0] == "vn":
-                vn.append(list(map(float, tokens[1:])))
-            elif tokens[0] == "vt":
-                vt.append(list(map(float, tokens[1:])))
-            elif tokens[0] == "f":
-                f.append(tokens[1:])
-
-    vertex_by_index = {}
-    v_new = []
-    vn_new = []
-    vt_new = []
-    f_new = []
-
-    for face in f:
-        for index in face:
-            if index.count("/") == 2 and index.count("//") == 0:
-                if index not in vertex_by_index:
-                    vertex_by_index[index] = len(v_new)
-                    vi, vti, vni = map(int, index.split("/"))
-                    v_new.append(v[vi - 1])
-                    vn_new.append(vn[vni - 1])
-                    vt_new.append(vt[vti - 1])
-
-    for face in f:
-        if face[0].count("/") == 2 and face[0].count("//") == 0:
-            f_new.append((vertex_by_index[index] + 1 for index in face[:3]))
-            if len(face) == 4:
-                f_new.append((vertex_by_index[index] + 1 for index in (face[0], face[2], face[3])))
-
-    with open(output_filename, "wt") as file:
-        for vertex in v_new:
-            file.write("v " + " ".join(map(str, vertex)) + "\n")
-        for vertex_normal in vn_new:
-            file.write("vn " + " ".join(map(str, vertex_normal)) + "\n")
-        for vertex_texture in vt_new:
-            file.write("vt " + " ".join(map(str, vertex_texture)) + "\n")
-        for face in f_new:
-            file.write("f " + " ".join(map(str, face)) + "\n")
-
-
-convert("cottage_indexed_fixed.obj", "cottage.obj")
+import sys
+
+import numpy
+
+from final.mesh_optimizer import optimize_mesh, print_statistics
+
+NEWLINE = ord("\n")
+CARRIAGE_RETURN = ord("\r")
+SLASH = ord("/")
+SPACE = ord(" ")
+
+OTHER, POSITION, NORMAL, TEXTURE, FACE = range(5)
+
+# lines written per call when saving the converted file
+WRITE_BLOCK_ROWS = 1 << 16
+
+
+def split_lines(data):
+    starts = numpy.concatenate(([0], numpy.flatnonzero(data == NEWLINE) + 1))
+    ends = numpy.append(starts[1:], len(data))
+    return starts, ends
+
+
+def classify_lines(data, starts):
+    padded = numpy.concatenate((data, numpy.zeros(3, numpy.uint8)))
+    first, second, third = padded[starts], padded[starts + 1], padded[starts + 2]
+    second_is_space = second <= SPACE
+    third_is_space = third <= SPACE
+
+    kinds = numpy.full(len(starts), OTHER, numpy.uint8)
+    kinds[(first == ord("v")) & second_is_space] = POSITION
+    kinds[(first == ord("v")) & (second == ord("n")) & third_is_space] = NORMAL
+    kinds[(first == ord("v")) & (second == ord("t")) & third_is_space] = TEXTURE
+    kinds[(first == ord("f")) & second_is_space] = FACE
+    return kinds
+
+
+def strip_line_endings(data, starts, ends):
+    ends = ends.copy()
+    for char in (NEWLINE, CARRIAGE_RETURN):
+        stripped = (ends > starts) & (data[numpy.maximum(ends, 1) - 1] == char)
+        ends[stripped] -= 1
+    return ends
+
+
+def count_per_line(positions, starts):
+    return numpy.bincount(numpy.searchsorted(starts, positions, "right") - 1, minlength=len(starts))
+
+
+def read_numbers(data, starts, ends, lines, prefix_length, dtype):
+    selected = numpy.zeros(len(starts), bool)
+    selected[lines] = True
+    text = data[numpy.repeat(selected, ends - starts)]
+    line_lengths = (ends - starts)[lines]
+    line_starts = numpy.cumsum(line_lengths) - line_lengths
+    for i in range(prefix_length):
+        text[line_starts + i] = SPACE
+    return numpy.fromstring(text.tobytes(), dtype=dtype, sep=" ")
+
+
+def read_faces(data, starts, ends, kinds):
+    is_space = data <= SPACE
+    token_starts = numpy.flatnonzero(~is_space & numpy.concatenate(([True], is_space[:-1])))
+    slashes = numpy.flatnonzero(data == SLASH)
+    double_slashes = slashes[:-1][numpy.diff(slashes) == 1]
+
+    # only faces where every corner is a full v/vt/vn triplet are converted
+    corner_counts = count_per_line(token_starts, starts) - 1
+    faces = numpy.flatnonzero(
+        (kinds == FACE)
+        & (corner_counts >= 3)
+        & (count_per_line(slashes, starts) == 2 * corner_counts)
+        & (count_per_line(double_slashes, starts) == 0)
+    )
+    corner_counts = corner_counts[faces]
+
+    text_data = data.copy()
+    text_data[slashes] = SPACE
+    corners = read_numbers(text_data, starts, ends, faces, 1, numpy.int64).reshape(-1, 3)
+    return faces, corner_counts, corners
+
+
+def resolve_negative_indices(corners, faces, corner_counts, kinds):
+    # a negative index counts back from the last element defined before the face
+    for column, kind in enumerate((POSITION, TEXTURE, NORMAL)):
+        defined_before = numpy.cumsum(kinds == kind)[faces]
+        defined_before = numpy.repeat(defined_before, corner_counts)
+        negative = corners[:, column] < 0
+        corners[negative, column] += defined_before[negative] + 1
+    return corners - 1
+
+
+def fan_triangulate(corner_counts):
+    face_offsets = numpy.cumsum(corner_counts) - corner_counts
+    triangle_counts = corner_counts - 2
+    first_corners = numpy.repeat(face_offsets, triangle_counts)
+    first_triangles = numpy.repeat(numpy.cumsum(triangle_counts) - triangle_counts, triangle_counts)
+    fan_steps = numpy.arange(len(first_corners)) - first_triangles + 1
+    return numpy.stack((first_corners, first_corners + fan_steps, first_corners + fan_steps + 1), axis=1)
+
+
+def unique_corners(corners):
+    # pack each v/vt/vn triplet into one integer key when it fits, sorting keys is much faster than sorting rows
+    ranges = corners.max(axis=0, initial=0) + 1
+    if numpy.prod(ranges.astype(float)) < 2 ** 63:
+        keys = (corners[:, 0] * ranges[1] + corners[:, 1]) * ranges[2] + corners[:, 2]
+        _, first_index, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+    else:
+        _, first_index, inverse = numpy.unique(corners, axis=0, return_index=True, return_inverse=True)
+
+    # vertices keep the order of their first appearance in the file
+    order = numpy.argsort(first_index)
+    rank = numpy.empty_like(order)
+    rank[order] = numpy.arange(len(order))
+    return corners[first_index[order]], rank[inverse.reshape(-1)]
+
+
+def write_lines(file, data, starts, ends, lines):
+    # records are copied as the original text of their lines, so no number is reformatted: the values match the
+    # previous converter, which wrote them with str(float), but not its formatting ("12.980520" stays as written)
+    padded = numpy.append(data, numpy.uint8(NEWLINE))
+    for block_start in range(0, len(lines), WRITE_BLOCK_ROWS):
+        block = lines[block_start:block_start + WRITE_BLOCK_ROWS]
+        lengths = ends[block] - starts[block] + 1
+        offsets = numpy.cumsum(lengths) - lengths
+        source = numpy.repeat(starts[block] - offsets, lengths) + numpy.arange(lengths.sum())
+        text = padded[source]
+        text[offsets + lengths - 1] = NEWLINE
+        file.write(text.tobytes())
+
+
+def write_faces(file, triangles):
+    for start in range(0, len(triangles), WRITE_BLOCK_ROWS):
+        block = triangles[start:start + WRITE_BLOCK_ROWS]
+        file.write(("f %d %d %d\n" * len(block) % tuple(block.ravel().tolist())).encode())
+
+
+def convert(input_filename, output_filename, optimize=False):
+    # the optimizer is pure Python and takes many times longer than the conversion itself, so it is opt-in
+    data = numpy.fromfile(input_filename, numpy.uint8)
+    starts, ends = split_lines(data)
+    kinds = classify_lines(data, starts)
+
+    faces, corner_counts, corners = read_faces(data, starts, ends, kinds)
+    corners = resolve_negative_indices(corners, faces, corner_counts, kinds)
+    vertices, vertex_by_corner = unique_corners(corners)
+    triangles = vertex_by_corner[fan_triangulate(corner_counts)]
+
+    if optimize:
+        position_lines = numpy.flatnonzero(kinds == POSITION)
+        positions = read_numbers(data, starts, ends, position_lines, 1, numpy.float64).reshape(len(position_lines), -1)
+        positions = positions[vertices[:, 0]]
+        print_statistics("before optimization", triangles, len(vertices))
+        order, triangles = optimize_mesh(triangles.ravel(), positions)
+        vertices, triangles = vertices[order], triangles.reshape(-1, 3)
+        print_statistics("after optimization", triangles, len(vertices))
+
+    content_ends = strip_line_endings(data, starts, ends)
+    with open(output_filename, "wb") as file:
+        write_lines(file, data, starts, content_ends, numpy.flatnonzero(kinds == POSITION)[vertices[:, 0]])
+        write_lines(file, data, starts, content_ends, numpy.flatnonzero(kinds == NORMAL)[vertices[:, 2]])
+        write_lines(file, data, starts, content_ends, numpy.flatnonzero(kinds == TEXTURE)[vertices[:, 1]])
+        write_faces(file, triangles + 1)
+
+
+if __name__ == "__main__":
+    convert("cottage_indexed_fixed.obj", "cottage.obj", optimize="--optimize" in sys.argv[1:])
@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+
+from mesh_cache import load_cached_mesh
+from obj_parser import parse_obj, parse_obj_parallel
+
+# the legacy loader keeps every number as a Python float, pass 5000000 for the size of a large scanned asset
+DEFAULT_VERTEX_COUNT = 500_000
+
+
+def legacy_load_mesh(filename):
+    v = []
+    vn = []
+    vt = []
+    f = []
+
+    with open(filename) as file:
+        for line in file.readlines():
+            tokens = line.split()
+            if len(tokens) == 0:
+                continue
+            if tokens[0] == "v":
+                v.append(list(map(float, tokens[1:])))
+            elif tokens[0] == "vn":
+                vn.append(list(map(float, tokens[1:])))
+            elif tokens[0] == "vt":
+                vt.append(list(map(float, tokens[1:])))
+            elif tokens[0] == "f":
+                f.append(list(map(int, tokens[1:])))
+
+    vertices = []
+    for (pos, normal, texture) in zip(v, vn, vt):
+        vertices.extend(pos)
+        vertices.extend(normal)
+        vertices.extend(texture[:2])
+
+    indices = []
+    for face in f:
+        for vi in face:
+            indices.append(vi - 1)
+
+    return vertices, indices
+
+
+def write_synthetic_obj(filename, vertex_count):
+    rng = numpy.random.default_rng(0)
+    with open(filename, "w") as file:
+        numpy.savetxt(file, rng.uniform(-100, 100, (vertex_count, 3)), fmt="v %.6f %.6f %.6f")
+        numpy.savetxt(file, rng.uniform(-1, 1, (vertex_count, 3)), fmt="vn %.6f %.6f %.6f")
+        numpy.savetxt(file, rng.uniform(0, 1, (vertex_count, 2)), fmt="vt %.6f %.6f")
+        numpy.savetxt(file, rng.integers(1, vertex_count + 1, (vertex_count * 2, 3)), fmt="f %d %d %d")
+
+
+def measure(function, filename):
+    start = time.perf_counter()
+    result = function(filename)
+    return time.perf_counter() - start, result
+
+
+def worker_counts():
+    counts = [1]
+    while counts[-1] * 2 <= os.cpu_count():
+        counts.append(counts[-1] * 2)
+    return counts if counts[-1] == os.cpu_count() else counts + [os.cpu_count()]
+
+
+def main():
+    vertex_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_VERTEX_COUNT
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "synthetic.obj")
+        write_synthetic_obj(filename, vertex_count)
+        print(f"{vertex_count} vertices, {os.path.getsize(filename) / 2 ** 20:.1f} MiB")
+
+        new_time, (vertices, indices) = measure(parse_obj, filename)
+        print(f"parse_obj:            {new_time:8.3f} s")
+
+        legacy_time, (legacy_vertices, legacy_indices) = measure(legacy_load_mesh, filename)
+        print(f"legacy load_mesh:     {legacy_time:8.3f} s")
+
+        assert numpy.allclose(vertices, numpy.array(legacy_vertices, numpy.float32))
+        assert numpy.array_equal(indices, numpy.array(legacy_indices, numpy.uint32))
+        print(f"speedup:              {legacy_time / new_time:8.1f}x")
+
+        # files smaller than MIN_RANGE_SIZE per worker are parsed by fewer processes
+        for workers in worker_counts():
+            parallel_time, (parallel_vertices, parallel_indices) = measure(
+                lambda name: parse_obj_parallel(name, workers), filename)
+            assert numpy.array_equal(vertices, parallel_vertices)
+            assert numpy.array_equal(indices, parallel_indices)
+            print(f"parallel, {workers:3} cpus:  {parallel_time:8.3f} s {legacy_time / parallel_time:8.1f}x")
+
+        cold_time, _ = measure(lambda name: load_cached_mesh(name, parse_obj, (3, 3, 2)), filename)
+        print(f"cache cold start:     {cold_time:8.3f} s")
+        warm_time, (cached_vertices, cached_indices, _) = measure(
+            lambda name: load_cached_mesh(name, parse_obj, (3, 3, 2)), filename)
+        print(f"cache warm start:     {warm_time:8.3f} s")
+
+        assert numpy.array_equal(vertices, cached_vertices)
+        assert numpy.array_equal(indices, cached_indices)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy
+
+CACHE_SUFFIX = ".mesh"
+MAGIC = b"MESH"
+VERSION = 1
+LOD_SUFFIX = ".lods"
+LOD_MAGIC = b"LODS"
+LOD_VERSION = 2
+MAX_ATTRIBUTES = 8
+DATA_ALIGNMENT = 64
+
+# magic, version, source size, source mtime, source sha256, vertex count, index count,
+# attribute count, attribute sizes, aabb min, aabb max
+HEADER = struct.Struct(f"<4sIQq32sQQI{MAX_ATTRIBUTES}B3f3f")
+MTIME_OFFSET = struct.calcsize("<4sIQ")
+DATA_OFFSET = (HEADER.size + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
+
+# magic, version, source size, source mtime, source sha256, target error, requested level count,
+# level count, index count; followed by an (offset, count, error) entry per level and the indices of all levels
+LOD_HEADER = struct.Struct("<4sIQq32sdIIQ")
+LOD_ENTRY = numpy.dtype([("offset", "<u8"), ("count", "<u8"), ("error", "<f8")])
+
+
+class MeshHeader:
+    def __init__(self, source_size, source_mtime, source_digest, vertex_count, index_count, attributes, aabb):
+        self.source_size = source_size
+        self.source_mtime = source_mtime
+        self.source_digest = source_digest
+        self.vertex_count = vertex_count
+        self.index_count = index_count
+        self.attributes = attributes
+        self.aabb = aabb
+
+    def pack(self):
+        attributes = tuple(self.attributes) + (0,) * (MAX_ATTRIBUTES - len(self.attributes))
+        return HEADER.pack(MAGIC, VERSION, self.source_size, self.source_mtime, self.source_digest,
+                           self.vertex_count, self.index_count, len(self.attributes), *attributes,
+                           *self.aabb[0], *self.aabb[1])
+
+    @staticmethod
+    def unpack(buffer):
+        fields = HEADER.unpack_from(buffer)
+        magic, version, source_size, source_mtime, source_digest, vertex_count, index_count, attribute_count = fields[:8]
+        if magic != MAGIC or version != VERSION:
+            return None
+        attributes = fields[8:8 + attribute_count]
+        aabb = (fields[8 + MAX_ATTRIBUTES:11 + MAX_ATTRIBUTES], fields[11 + MAX_ATTRIBUTES:14 + MAX_ATTRIBUTES])
+        return MeshHeader(source_size, source_mtime, source_digest, vertex_count, index_count, attributes, aabb)
+
+    def vertex_floats(self):
+        return self.vertex_count * sum(self.attributes)
+
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class MeshCacheWriter:
+    def __init__(self, filename, attributes, variant=""):
+        self.filename = filename
+        self.cache_filename = cache_filename_for(filename, variant)
+        self.source_stat = os.stat(filename)
+        self.attributes = attributes
+        self.vertex_file = tempfile.TemporaryFile()
+        self.index_file = tempfile.TemporaryFile()
+        self.vertex_count = 0
+        self.index_count = 0
+        self.aabb_min = numpy.full(3, numpy.inf, numpy.float32)
+        self.aabb_max = numpy.full(3, -numpy.inf, numpy.float32)
+
+    def append(self, vertices, indices):
+        vertices = numpy.ascontiguousarray(vertices, numpy.float32)
+        indices = numpy.ascontiguousarray(indices, numpy.uint32)
+        positions = vertices.reshape(-1, sum(self.attributes))[:, :self.attributes[0]]
+        if len(positions) > 0:
+            numpy.minimum(self.aabb_min, positions.min(axis=0), out=self.aabb_min)
+            numpy.maximum(self.aabb_max, positions.max(axis=0), out=self.aabb_max)
+        self.vertex_file.write(vertices.data)
+        self.index_file.write(indices.data)
+        self.vertex_count += len(positions)
+        self.index_count += len(indices)
+
+    def finish(self):
+        aabb = (self.aabb_min, self.aabb_max) if self.vertex_count > 0 else ((0, 0, 0), (0, 0, 0))
+        header = MeshHeader(self.source_stat.st_size, self.source_stat.st_mtime_ns, file_digest(self.filename),
+                            self.vertex_count, self.index_count, self.attributes, aabb)
+
+        def write(file):
+            file.write(header.pack().ljust(DATA_OFFSET, b"\0"))
+            for block in (self.vertex_file, self.index_file):
+                block.seek(0)
+                shutil.copyfileobj(block, file)
+
+        try:
+            write_cache_file(self.cache_filename, write)
+        finally:
+            self.vertex_file.close()
+            self.index_file.close()
+
+
+def write_cache_file(cache_filename, write):
+    tmp_filename = f"{cache_filename}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_filename, "wb") as file:
+            write(file)
+        os.replace(tmp_filename, cache_filename)
+    except OSError as e:
+        print(f"Could not write mesh cache {cache_filename}: {e}")
+
+
+def map_mesh_cache(cache_filename):
+    if os.path.getsize(cache_filename) < DATA_OFFSET:
+        return None, None, None
+
+    with open(cache_filename, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    header = MeshHeader.unpack(mapped)
+    if header is None or len(mapped) != DATA_OFFSET + 4 * (header.vertex_floats() + header.index_count):
+        return None, None, None
+
+    vertices = numpy.frombuffer(mapped, numpy.float32, header.vertex_floats(), DATA_OFFSET)
+    indices = numpy.frombuffer(mapped, numpy.uint32, header.index_count, DATA_OFFSET + vertices.nbytes)
+    return header, vertices, indices
+
+
+def touch_mesh_cache(cache_filename, source_mtime):
+    with open(cache_filename, "r+b") as file:
+        file.seek(MTIME_OFFSET)
+        file.write(struct.pack("<q", source_mtime))
+
+
+def cache_filename_for(filename, variant, suffix=CACHE_SUFFIX):
+    return f"{filename}.{variant}{suffix}" if variant else filename + suffix
+
+
+# both cache formats start with the source size, mtime and digest at the same offsets
+def source_matches(filename, cache_filename, source_size, source_mtime, source_digest):
+    source_stat = os.stat(filename)
+    if source_size != source_stat.st_size:
+        return False
+    if source_mtime != source_stat.st_mtime_ns:
+        if source_digest != file_digest(filename):
+            return False
+        touch_mesh_cache(cache_filename, source_stat.st_mtime_ns)
+    return True
+
+
+def open_cached_mesh(filename, variant=""):
+    cache_filename = cache_filename_for(filename, variant)
+    if not os.path.exists(cache_filename):
+        return None
+
+    header, vertices, indices = map_mesh_cache(cache_filename)
+    if header is None or not source_matches(filename, cache_filename, header.source_size, header.source_mtime,
+                                            header.source_digest):
+        return None
+    return vertices, indices, header.attributes
+
+
+# variant tells apart caches of the same source built with different processing
+def load_cached_mesh(filename, parse, attributes, variant=""):
+    cached = open_cached_mesh(filename, variant)
+    if cached is not None:
+        return cached
+
+    vertices, indices = parse(filename)
+    writer = MeshCacheWriter(filename, attributes, variant)
+    writer.append(vertices, indices)
+    writer.finish()
+    return vertices, indices, attributes
+
+
+def stream_cached_mesh(filename, parse_chunks, attributes):
+    cached = open_cached_mesh(filename)
+    if cached is not None:
+        yield cached[:2]
+        return
+
+    writer = MeshCacheWriter(filename, attributes)
+    for vertices, indices in parse_chunks(filename):
+        writer.append(vertices, indices)
+        yield vertices, indices
+    writer.finish()
+
+
+def write_lod_cache(filename, variant, target_error, lod_count, indices, lods):
+    source_stat = os.stat(filename)
+    indices = numpy.ascontiguousarray(indices, numpy.uint32)
+    header = LOD_HEADER.pack(LOD_MAGIC, LOD_VERSION, source_stat.st_size, source_stat.st_mtime_ns,
+                             file_digest(filename), target_error, lod_count, len(lods), len(indices))
+
+    def write(file):
+        file.write(header.ljust(DATA_OFFSET, b"\0"))
+        file.write(numpy.array(lods, LOD_ENTRY).data)
+        file.write(indices.data)
+
+    write_cache_file(cache_filename_for(filename, variant, LOD_SUFFIX), write)
+
+
+def open_cached_lods(filename, target_error, lod_count, variant=""):
+    cache_filename = cache_filename_for(filename, variant, LOD_SUFFIX)
+    if not os.path.exists(cache_filename) or os.path.getsize(cache_filename) < DATA_OFFSET:
+        return None
+
+    with open(cache_filename, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    (magic, version, source_size, source_mtime, source_digest, cached_target_error, cached_lod_count, level_count,
+     index_count) = LOD_HEADER.unpack_from(mapped)
+    if (magic != LOD_MAGIC or version != LOD_VERSION or cached_target_error != target_error or
+            cached_lod_count != lod_count or
+            len(mapped) != DATA_OFFSET + level_count * LOD_ENTRY.itemsize + 4 * index_count):
+        return None
+    if not source_matches(filename, cache_filename, source_size, source_mtime, source_digest):
+        return None
+
+    lods = numpy.frombuffer(mapped, LOD_ENTRY, level_count, DATA_OFFSET)
+    indices = numpy.frombuffer(mapped, numpy.uint32, index_count, DATA_OFFSET + lods.nbytes)
+    return indices, [(int(offset), int(count), float(error)) for offset, count, error in lods]
+
+
+# the levels index the vertex buffer of the mesh cache with the same variant
+def load_cached_lods(filename, build, target_error, lod_count, variant=""):
+    cached = open_cached_lods(filename, target_error, lod_count, variant)
+    if cached is not None:
+        return cached
+
+    indices, lods = build()
+    write_lod_cache(filename, variant, target_error, lod_count, indices, lods)
+    return indices, lods
@@ -0,0 +1,173 @@
+import numpy
+
+# size of the simulated post-transform cache used for reordering
+CACHE_SIZE = 32
+# size of the FIFO cache used for ACMR / ATVR statistics
+ANALYZE_CACHE_SIZE = 16
+
+# Forsyth vertex score parameters
+LAST_TRIANGLE_SCORE = 0.75
+CACHE_DECAY_POWER = 1.5
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = -0.5
+
+
+def simulate_fifo_cache(indices, cache_size):
+    # a vertex is still cached if fewer than cache_size misses happened since it was loaded
+    inserted = {}
+    misses = 0
+    missed = bytearray(len(indices))
+    for i, vertex in enumerate(indices):
+        if misses - inserted.get(vertex, -cache_size - 1) > cache_size:
+            inserted[vertex] = misses
+            misses += 1
+            missed[i] = 1
+    return numpy.frombuffer(missed, numpy.uint8)
+
+
+def analyze_vertex_cache(indices, vertex_count, cache_size=ANALYZE_CACHE_SIZE):
+    indices = numpy.asarray(indices).ravel().tolist()
+    misses = int(simulate_fifo_cache(indices, cache_size).sum())
+    triangle_count = len(indices) // 3
+    acmr = misses / triangle_count if triangle_count else 0
+    atvr = misses / vertex_count if vertex_count else 0
+    return acmr, atvr
+
+
+def vertex_score(cache_position, remaining_valence, cache_size):
+    if remaining_valence == 0:
+        return -1.0
+
+    score = 0.0
+    if cache_position >= 0:
+        if cache_position < 3:
+            score = LAST_TRIANGLE_SCORE
+        else:
+            score = (1 - (cache_position - 3) / (cache_size - 3)) ** CACHE_DECAY_POWER
+    return score + VALENCE_BOOST_SCALE * remaining_valence ** VALENCE_BOOST_POWER
+
+
+def optimize_vertex_cache(indices, vertex_count, cache_size=CACHE_SIZE):
+    triangles = numpy.asarray(indices, numpy.int64).reshape(-1, 3)
+    triangle_count = len(triangles)
+    if triangle_count == 0:
+        return numpy.asarray(indices, numpy.uint32)
+
+    # triangles adjacent to every vertex
+    corner_triangles = numpy.argsort(triangles.ravel(), kind="stable") // 3
+    valence = numpy.bincount(triangles.ravel(), minlength=vertex_count)
+    bounds = numpy.concatenate(([0], numpy.cumsum(valence))).tolist()
+    corner_triangles = corner_triangles.tolist()
+    vertex_triangles = [corner_triangles[bounds[v]:bounds[v + 1]] for v in range(vertex_count)]
+
+    valence = valence.tolist()
+    triangle_vertices = triangles.tolist()
+    cache_position = [-1] * vertex_count
+    scores = [vertex_score(-1, valence[v], cache_size) for v in range(vertex_count)]
+    triangle_scores = [scores[a] + scores[b] + scores[c] for a, b, c in triangle_vertices]
+    emitted = bytearray(triangle_count)
+
+    cache = []
+    order = []
+    best = max(range(triangle_count), key=triangle_scores.__getitem__)
+    cursor = 0
+
+    while len(order) < triangle_count:
+        if best < 0:
+            # dead end, continue with the next triangle in input order
+            while emitted[cursor]:
+                cursor += 1
+            best = cursor
+
+        order.append(best)
+        emitted[best] = 1
+        corners = triangle_vertices[best]
+        for v in corners:
+            valence[v] -= 1
+            vertex_triangles[v].remove(best)
+
+        new_cache = corners + [v for v in cache if v not in corners]
+        for v in new_cache[cache_size:]:
+            cache_position[v] = -1
+        cache = new_cache[:cache_size]
+        for position, v in enumerate(cache):
+            cache_position[v] = position
+
+        best = -1
+        best_score = -1.0
+        for v in new_cache:
+            score = vertex_score(cache_position[v], valence[v], cache_size)
+            delta = score - scores[v]
+            scores[v] = score
+            for t in vertex_triangles[v]:
+                triangle_scores[t] += delta
+        for v in cache:
+            for t in vertex_triangles[v]:
+                if triangle_scores[t] > best_score:
+                    best = t
+                    best_score = triangle_scores[t]
+
+    return triangles[order].ravel().astype(numpy.uint32)
+
+
+def optimize_overdraw(indices, positions, cache_size=CACHE_SIZE):
+    triangles = numpy.asarray(indices, numpy.int64).reshape(-1, 3)
+    if len(triangles) == 0:
+        return numpy.asarray(indices, numpy.uint32)
+
+    # clusters start where the cache is cold anyway, so reordering them barely changes the cache efficiency
+    missed = simulate_fifo_cache(triangles.ravel().tolist(), cache_size).reshape(-1, 3)
+    cluster_ids = numpy.cumsum(missed.sum(axis=1) == 3) - 1
+    cluster_ids[cluster_ids < 0] = 0
+    cluster_count = cluster_ids[-1] + 1
+
+    corners = numpy.asarray(positions, numpy.float64)[:, :3][triangles]
+    normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    areas = numpy.linalg.norm(normals, axis=1)
+    centroids = corners.mean(axis=1)
+    mesh_centroid = (centroids * areas[:, None]).sum(axis=0) / max(areas.sum(), 1e-20)
+
+    def per_cluster(values):
+        return numpy.stack([numpy.bincount(cluster_ids, values[:, i], cluster_count) for i in range(3)], axis=1)
+
+    cluster_areas = numpy.maximum(numpy.bincount(cluster_ids, areas, cluster_count), 1e-20)
+    cluster_centroids = per_cluster(centroids * areas[:, None]) / cluster_areas[:, None]
+    cluster_normals = per_cluster(normals)
+    cluster_normals /= numpy.maximum(numpy.linalg.norm(cluster_normals, axis=1), 1e-20)[:, None]
+
+    # clusters facing away from the mesh center are drawn first, they tend to occlude the rest
+    facing = ((cluster_centroids - mesh_centroid) * cluster_normals).sum(axis=1)
+    cluster_order = numpy.argsort(-facing, kind="stable")
+    cluster_rank = numpy.empty(cluster_count, numpy.int64)
+    cluster_rank[cluster_order] = numpy.arange(cluster_count)
+    triangle_order = numpy.argsort(cluster_rank[cluster_ids], kind="stable")
+    return triangles[triangle_order].ravel().astype(numpy.uint32)
+
+
+def optimize_vertex_fetch(indices, vertex_count):
+    # vertices are renumbered in order of first use, unused vertices go last
+    indices = numpy.asarray(indices, numpy.int64)
+    first_use = numpy.full(vertex_count, len(indices), numpy.int64)
+    numpy.minimum.at(first_use, indices, numpy.arange(len(indices)))
+    order = numpy.argsort(first_use, kind="stable")
+    remap = numpy.empty(vertex_count, numpy.int64)
+    remap[order] = numpy.arange(vertex_count)
+    return order, remap[indices].astype(numpy.uint32)
+
+
+def optimize_mesh(indices, positions):
+    vertex_count = len(positions)
+    indices = optimize_vertex_cache(indices, vertex_count)
+    indices = optimize_overdraw(indices, positions)
+    return optimize_vertex_fetch(indices, vertex_count)
+
+
+def print_statistics(name, indices, vertex_count):
+    acmr, atvr = analyze_vertex_cache(indices, vertex_count)
+    print(f"{name}: ACMR {acmr:.3f}, ATVR {atvr:.3f}")
+
+
+def optimize_interleaved(vertices, indices, vertex_size):
+    vertices = numpy.asarray(vertices).reshape(-1, vertex_size)
+    order, indices = optimize_mesh(indices, vertices[:, :3])
+    return vertices[order].ravel(), indices
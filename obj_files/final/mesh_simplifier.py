@@ -0,0 +1,215 @@
+import heapq
+
+import numpy
+
+from mesh_optimizer import optimize_vertex_cache
+
+# every level keeps about this fraction of the triangles of the previous one
+LOD_RATIO = 0.5
+LOD_COUNT = 5
+# largest simplification error of the coarsest level, relative to the mesh extent
+LOD_TARGET_ERROR = 0.05
+
+# border edges are held in place by planes perpendicular to them with this weight
+BORDER_WEIGHT = 10.0
+
+
+def plane_quadrics(normals, points, weights):
+    # quadric of the squared distance to the plane n.p + d = 0 as its 10 unique coefficients
+    d = -(normals * points).sum(axis=1)
+    a, b, c = normals.T
+    return weights[:, None] * numpy.stack((a * a, a * b, a * c, a * d, b * b, b * c, b * d, c * c, c * d, d * d), axis=1)
+
+
+def quadric_error(q, p):
+    # q[10] is the summed area of the faces in q, dividing by it turns the area weighted sum of squared plane
+    # distances into their mean, so the error is a squared distance in mesh units whatever the triangle sizes
+    x, y, z = p
+    error = (q[0] * x * x + 2 * q[1] * x * y + 2 * q[2] * x * z + 2 * q[3] * x + q[4] * y * y + 2 * q[5] * y * z +
+             2 * q[6] * y + q[7] * z * z + 2 * q[8] * z + q[9])
+    return error / q[10] if q[10] > 0 else error
+
+
+def triangle_normal(a, b, c):
+    ux, uy, uz = b[0] - a[0], b[1] - a[1], b[2] - a[2]
+    vx, vy, vz = c[0] - a[0], c[1] - a[1], c[2] - a[2]
+    return uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx
+
+
+def vertex_quadrics(positions, triangles, vertex_count):
+    corners = positions[triangles]
+    normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    areas = numpy.linalg.norm(normals, axis=1)
+    unit_normals = normals / areas[:, None]
+    face = plane_quadrics(unit_normals, corners[:, 0], areas / 2)
+
+    # the 10 coefficients and the area weight of the faces summed into the quadric
+    quadrics = numpy.zeros((vertex_count, 11))
+    for i in range(3):
+        numpy.add.at(quadrics[:, :10], triangles[:, i], face)
+        numpy.add.at(quadrics[:, 10], triangles[:, i], areas / 2)
+
+    # edges used by a single triangle are borders
+    edges = numpy.concatenate((triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]))
+    edge_faces = numpy.tile(numpy.arange(len(triangles)), 3)
+    keys = numpy.sort(edges, axis=1)
+    _, inverse, counts = numpy.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    border = counts[inverse.ravel()] == 1
+    if numpy.any(border):
+        edges, edge_faces = edges[border], edge_faces[border]
+        directions = positions[edges[:, 1]] - positions[edges[:, 0]]
+        lengths = numpy.linalg.norm(directions, axis=1)
+        planes = numpy.cross(directions, unit_normals[edge_faces])
+        planes /= numpy.maximum(numpy.linalg.norm(planes, axis=1), 1e-20)[:, None]
+        border_quadrics = plane_quadrics(planes, positions[edges[:, 0]], BORDER_WEIGHT * lengths ** 2)
+        # border planes add to the error but not to the weight, they only penalize moving along the border
+        for i in range(2):
+            numpy.add.at(quadrics[:, :10], edges[:, i], border_quadrics)
+    return quadrics
+
+
+class Simplifier:
+    # collapses edges of the position-welded mesh onto one of their endpoints, so every level keeps
+    # indexing the original vertex buffer
+    def __init__(self, positions, attributes, indices):
+        positions = numpy.asarray(positions, numpy.float64)
+        welded_positions, weld = numpy.unique(positions, axis=0, return_inverse=True)
+        weld = weld.ravel()
+        triangles = numpy.asarray(indices, numpy.int64).reshape(-1, 3)
+        welded = weld[triangles]
+
+        corners = welded_positions[welded]
+        areas = numpy.linalg.norm(numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]), axis=1)
+        keep = areas > 0
+        triangles, welded = triangles[keep], welded[keep]
+
+        self.positions = welded_positions.tolist()
+        self.attributes = numpy.asarray(attributes, numpy.float64)
+        self.quadrics = vertex_quadrics(welded_positions, welded, len(welded_positions)).tolist()
+        self.scale = float(numpy.max(numpy.ptp(positions, axis=0))) if len(positions) else 1.0
+
+        order = numpy.argsort(weld, kind="stable")
+        bounds = numpy.searchsorted(weld[order], numpy.arange(len(welded_positions) + 1)).tolist()
+        order = order.tolist()
+        self.siblings = [order[bounds[v]:bounds[v + 1]] for v in range(len(welded_positions))]
+        self.sibling_cache = {}
+
+        self.corners = welded.tolist()
+        self.original_corners = triangles.tolist()
+        self.alive = bytearray(b"\1") * len(triangles)
+        self.triangle_count = len(triangles)
+        self.vertex_triangles = [set() for _ in welded_positions]
+        for t, corners in enumerate(self.corners):
+            for v in corners:
+                self.vertex_triangles[v].add(t)
+        self.version = [0] * len(welded_positions)
+        self.error = 0.0
+
+        self.heap = []
+        for a, b in numpy.unique(numpy.sort(numpy.concatenate((welded[:, :2], welded[:, 1:], welded[:, ::2])),
+                                            axis=1), axis=0).tolist():
+            self.push_edge(a, b)
+
+    def collapse_cost(self, u, v):
+        q_u, q_v = self.quadrics[u], self.quadrics[v]
+        return quadric_error([x + y for x, y in zip(q_u, q_v)], self.positions[v])
+
+    def push_edge(self, a, b):
+        cost_ab = self.collapse_cost(a, b)
+        cost_ba = self.collapse_cost(b, a)
+        u, v, cost = (a, b, cost_ab) if cost_ab <= cost_ba else (b, a, cost_ba)
+        heapq.heappush(self.heap, (max(cost, 0.0), u, v, self.version[u], self.version[v]))
+
+    def neighbors(self, v):
+        return {w for t in self.vertex_triangles[v] for w in self.corners[t]} - {v}
+
+    def can_collapse(self, u, v):
+        # the edge may only be shared by the triangles that disappear with it, otherwise the mesh folds
+        shared = self.vertex_triangles[u] & self.vertex_triangles[v]
+        opposite = {w for t in shared for w in self.corners[t]} - {u, v}
+        if self.neighbors(u) & self.neighbors(v) != opposite:
+            return False
+
+        # no remaining triangle may flip over
+        for t in self.vertex_triangles[u] - shared:
+            points = [self.positions[w] for w in self.corners[t]]
+            before = triangle_normal(*points)
+            points[self.corners[t].index(u)] = self.positions[v]
+            after = triangle_normal(*points)
+            if sum(x * y for x, y in zip(before, after)) <= 0:
+                return False
+        return True
+
+    def sibling(self, vertex, v):
+        # the vertex at the new position whose normal and uv are closest to the replaced one
+        key = (vertex, v)
+        if key not in self.sibling_cache:
+            siblings = self.siblings[v]
+            distances = ((self.attributes[siblings] - self.attributes[vertex]) ** 2).sum(axis=1)
+            self.sibling_cache[key] = siblings[int(numpy.argmin(distances))]
+        return self.sibling_cache[key]
+
+    def collapse(self, u, v):
+        for t in self.vertex_triangles[u]:
+            corners = self.corners[t]
+            if v in corners:
+                self.alive[t] = 0
+                self.triangle_count -= 1
+                for w in corners:
+                    if w != u:
+                        self.vertex_triangles[w].discard(t)
+            else:
+                i = corners.index(u)
+                corners[i] = v
+                self.original_corners[t][i] = self.sibling(self.original_corners[t][i], v)
+                self.vertex_triangles[v].add(t)
+        self.vertex_triangles[u] = set()
+        self.quadrics[v] = [x + y for x, y in zip(self.quadrics[u], self.quadrics[v])]
+        self.version[u] += 1
+        self.version[v] += 1
+        for w in self.neighbors(v):
+            self.push_edge(v, w)
+
+    def simplify(self, target_count, target_error):
+        # returns False once no collapse within the error target is left
+        limit = (target_error * self.scale) ** 2
+        while self.triangle_count > target_count:
+            if not self.heap or self.heap[0][0] > limit:
+                return False
+            cost, u, v, version_u, version_v = heapq.heappop(self.heap)
+            if version_u != self.version[u] or version_v != self.version[v] or not self.can_collapse(u, v):
+                continue
+            self.collapse(u, v)
+            self.error = max(self.error, cost ** 0.5)
+        return True
+
+    def indices(self):
+        return numpy.array([c for t, c in enumerate(self.original_corners) if self.alive[t]], numpy.uint32).ravel()
+
+
+# returns all levels in one index array and a (offset, count, error) entry per level, errors are in mesh units
+def build_lod_chain(vertices, indices, vertex_size, target_error=LOD_TARGET_ERROR, lod_count=LOD_COUNT,
+                    optimize=False):
+    vertices = numpy.asarray(vertices, numpy.float32).reshape(-1, vertex_size)
+    indices = numpy.asarray(indices, numpy.uint32)
+    simplifier = Simplifier(vertices[:, :3], vertices[:, 3:], indices)
+
+    levels = [(indices, 0.0)]
+    target_count = len(indices) // 3
+    while len(levels) < lod_count:
+        target_count = int(target_count * LOD_RATIO)
+        reached = simplifier.simplify(target_count, target_error)
+        if simplifier.triangle_count * 3 < len(levels[-1][0]):
+            level = simplifier.indices()
+            if optimize:
+                level = optimize_vertex_cache(level, len(vertices))
+            levels.append((level, simplifier.error))
+        if not reached:
+            break
+
+    lods = []
+    offset = 0
+    for level, error in levels:
+        lods.append((offset, len(level), error))
+        offset += len(level)
+    return numpy.concatenate([level for level, _ in levels]), lods
@@ -0,0 +1,37 @@
+#version 410
+
+layout (location = 0) in vec3 vPos;
+layout (location = 1) in vec4 vNormal;
+layout (location = 2) in vec2 vTexCoord;
+
+uniform mat4 model;
+uniform mat4 view;
+uniform mat4 projection;
+
+uniform vec3 aabbMin;
+uniform vec3 aabbExtent;
+uniform bool octahedralNormals;
+
+out vec3 pos;
+out vec3 normal;
+out vec2 texCoord;
+
+vec3 octahedralDecode(vec2 e)
+{
+    vec3 n = vec3(e, 1.0 - abs(e.x) - abs(e.y));
+    float t = max(-n.z, 0.0);
+    n.x += n.x >= 0.0 ? -t : t;
+    n.y += n.y >= 0.0 ? -t : t;
+    return normalize(n);
+}
+
+void main()
+{
+    vec3 position = aabbMin + vPos * aabbExtent;
+    vec3 objectNormal = octahedralNormals ? octahedralDecode(vNormal.xy) : vNormal.xyz;
+
+    gl_Position = projection * view * model * vec4(position, 1.0);
+    pos = vec3(model * vec4(position, 1.0));
+    normal = normalize(mat3(inverse(transpose(model))) * objectNormal);
+    texCoord = vTexCoord;
+}
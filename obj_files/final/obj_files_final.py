@@ -6,7 +6,24 @@ import glm
 import numpy
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
-from PIL import Image, ImageOps
+from PIL import Image
+
+from mesh_cache import load_cached_lods, load_cached_mesh, stream_cached_mesh
+from mesh_optimizer import optimize_interleaved, print_statistics
+from mesh_simplifier import LOD_COUNT, LOD_TARGET_ERROR, build_lod_chain
+from obj_parser import iter_obj_chunks, parse_obj, parse_obj_parallel
+from vertex_formats import COMPACT_FORMAT, NORMAL_OCT16, float_format, position_bounds
+
+# draw the cottage from quantized vertices (16-bit positions, octahedral normals, half-float uvs)
+COMPACT_VERTICES = False
+# draw a grid of cottages, each picking its level of detail from the distance to the camera
+LOD_SCENE = False
+LOD_SCENE_SIZE = 6
+LOD_SCENE_SPACING = 130
+
+FIELD_OF_VIEW = glm.radians(45)
+# largest simplification error allowed on screen, as a fraction of the screen height
+LOD_SCREEN_ERROR = 0.002
 
 
 class Camera:
@@ -92,11 +109,11 @@ def init_glfw(width, height, title):
     return window
 
 
-def build_shader(shader_name):
+def build_shader(shader_name, fragment_shader_name=None):
     try:
         return compileProgram(
             compileShader(read_shader_file(f"{shader_name}.vs"), GL_VERTEX_SHADER),
-            compileShader(read_shader_file(f"{shader_name}.fs"), GL_FRAGMENT_SHADER)
+            compileShader(read_shader_file(f"{fragment_shader_name or shader_name}.fs"), GL_FRAGMENT_SHADER)
         )
     except RuntimeError as e:
         print(str(e.args[0]).replace("b\"", "\n").replace("\\n", "\n"))
@@ -110,81 +127,213 @@ def load_matrix_to_shader(shader_program, matrix, matrix_name):
 
 def resize(width, height, shader_program):
     if min(width, height) > 0:
-        projection = glm.perspective(glm.radians(45), width / height, 0.1, 100)
+        projection = glm.perspective(FIELD_OF_VIEW, width / height, 0.1, 1000)
         load_matrix_to_shader(shader_program, projection, "projection")
         glViewport(0, 0, width, height)
 
 
+def buffer_data(data, dtype=numpy.float32):
+    # lists are converted once, raw bytes (an mmap, a bytes memoryview) are read as dtype,
+    # typed buffers (NumPy arrays, array.array) are passed to GL as they are and must already match it
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    return data
+
+
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    data = buffer_data(data, dtype)
+    glBufferData(target, data.nbytes, data, usage)
+
+
+def update_buffer(target, offset, data, dtype=numpy.float32):
+    data = buffer_data(data, dtype)
+    glBufferSubData(target, offset, data.nbytes, data)
+
+
+def grow_buffer(target, buffer_id, used_size, capacity, required_size):
+    if required_size <= capacity:
+        return buffer_id, capacity
+
+    new_capacity = max(required_size, 2 * capacity)
+    new_buffer_id = glGenBuffers(1)
+    glBindBuffer(GL_COPY_WRITE_BUFFER, new_buffer_id)
+    glBufferData(GL_COPY_WRITE_BUFFER, new_capacity, None, GL_STATIC_DRAW)
+    if used_size > 0:
+        glBindBuffer(GL_COPY_READ_BUFFER, buffer_id)
+        glCopyBufferSubData(GL_COPY_READ_BUFFER, GL_COPY_WRITE_BUFFER, 0, 0, used_size)
+    glDeleteBuffers(1, [buffer_id])
+    glBindBuffer(target, new_buffer_id)
+    return new_buffer_id, new_capacity
+
+
+def index_type_for(vertex_count):
+    if vertex_count < 1 << 16:
+        return GL_UNSIGNED_SHORT, numpy.uint16
+    return GL_UNSIGNED_INT, numpy.uint32
+
+
 class Mesh:
-    def __init__(self, vertices, indices, attributes):
+    # lods are (offset, count, error) entries into indices, from the full mesh to the coarsest level
+    def __init__(self, vertices, indices, attributes, vertex_format=None, lods=None):
         self.vertices = vertices
         self.indices = indices
         self.attributes = attributes
+        self.vertex_format = vertex_format or float_format(attributes)
+        self.aabb = None
         self.vertex_array_id = None
+        self.vertex_buffer_id = None
+        self.index_buffer_id = None
+        self.index_type = GL_UNSIGNED_INT
+        self.index_size = sizeof(GLuint)
+        self.index_count = len(indices)
+        self.lods = lods
+        if lods is not None:
+            low, extent = position_bounds(vertices, attributes)
+            self.center = glm.vec3(*(low + extent / 2))
+            self.radius = float(numpy.linalg.norm(extent)) / 2
 
     def bind_attributes(self):
-        vertices = (GLfloat * len(self.vertices))(*self.vertices)
+        if not self.vertex_format.is_float():
+            self.aabb = position_bounds(self.vertices, self.attributes)
+        vertices = self.vertex_format.pack(numpy.asarray(self.vertices, numpy.float32), self.attributes, self.aabb)
+        self.vertex_array_id = glGenVertexArrays(1)
+        glBindVertexArray(self.vertex_array_id)
+        self.vertex_buffer_id = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer_id)
+        upload_buffer(GL_ARRAY_BUFFER, vertices, dtype=vertices.dtype)
+        self.set_attribute_pointers()
+
+        # the element buffer binding is part of the vertex array state, so the indices are uploaded only once
+        self.index_type, index_dtype = index_type_for(len(vertices))
+        indices = numpy.asarray(self.indices, numpy.uint32).astype(index_dtype, copy=False)
+        self.index_size = indices.itemsize
+        self.index_buffer_id = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer_id)
+        upload_buffer(GL_ELEMENT_ARRAY_BUFFER, indices, dtype=index_dtype)
+
+    def set_attribute_pointers(self):
+        self.vertex_format.set_attribute_pointers()
+
+    # the mesh starts empty and grows with every append, only the uploaded part of the indices is drawn.
+    # The final vertex count is not known up front, so streamed indices are always 32-bit.
+    # Quantized vertex formats need self.aabb to be set before the first append.
+    def bind_streaming_attributes(self):
         self.vertex_array_id = glGenVertexArrays(1)
         glBindVertexArray(self.vertex_array_id)
-        glBindBuffer(GL_ARRAY_BUFFER, glGenBuffers(1))
-        glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), vertices, GL_STATIC_DRAW)
+        self.vertex_buffer_id = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer_id)
+        self.index_buffer_id = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer_id)
+        self.vertex_capacity = 0
+        self.index_capacity = 0
+        self.vertex_size = 0
+        self.index_count = 0
+        self.set_attribute_pointers()
+
+    def append(self, vertices, indices):
+        vertices = self.vertex_format.pack(numpy.asarray(vertices, numpy.float32), self.attributes, self.aabb)
+        indices = numpy.asarray(indices, numpy.uint32)
+        glBindVertexArray(self.vertex_array_id)
 
-        vertex_size = sum(self.attributes)
-        offset = 0
+        if vertices.nbytes > 0:
+            glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer_id)
+            buffer_id, self.vertex_capacity = grow_buffer(GL_ARRAY_BUFFER, self.vertex_buffer_id, self.vertex_size,
+                                                          self.vertex_capacity, self.vertex_size + vertices.nbytes)
+            if buffer_id != self.vertex_buffer_id:
+                self.vertex_buffer_id = buffer_id
+                self.set_attribute_pointers()
+            update_buffer(GL_ARRAY_BUFFER, self.vertex_size, vertices, vertices.dtype)
+            self.vertex_size += vertices.nbytes
+
+        if indices.nbytes > 0:
+            index_bytes = self.index_count * sizeof(GLuint)
+            self.index_buffer_id, self.index_capacity = grow_buffer(GL_ELEMENT_ARRAY_BUFFER, self.index_buffer_id,
+                                                                    index_bytes, self.index_capacity,
+                                                                    index_bytes + indices.nbytes)
+            update_buffer(GL_ELEMENT_ARRAY_BUFFER, index_bytes, indices, numpy.uint32)
+            self.index_count += len(indices)
+
+    def select_lod(self, camera, model):
+        if self.lods is None:
+            return 0, self.index_count
+        if camera is None:
+            return self.lods[0][:2]
+
+        scale = max(glm.length(glm.vec3(model[i])) for i in range(3))
+        distance = glm.distance(camera.pos, glm.vec3(model * glm.vec4(self.center, 1))) - self.radius * scale
+        if distance <= 0:
+            return self.lods[0][:2]
+
+        # the coarsest level whose error projects below LOD_SCREEN_ERROR of the screen height
+        allowed_error = LOD_SCREEN_ERROR * 2 * distance * glm.tan(FIELD_OF_VIEW / 2) / scale
+        offset, count, _ = next(lod for lod in reversed(self.lods) if lod[2] <= allowed_error or lod is self.lods[0])
+        return offset, count
+
+    # returns the number of drawn triangles
+    def draw(self, camera=None, model=glm.mat4()):
+        offset, count = self.select_lod(camera, model)
+        glBindVertexArray(self.vertex_array_id)
+        glDrawElements(GL_TRIANGLES, count, self.index_type, c_void_p(offset * self.index_size))
+        return count // 3
 
-        for i, attribute in enumerate(self.attributes):
-            glVertexAttribPointer(i, attribute, GL_FLOAT, GL_FALSE, vertex_size * sizeof(GLfloat),
-                                  c_void_p(offset * sizeof(GLfloat)))
-            glEnableVertexAttribArray(i)
-            offset += attribute
 
-    def draw(self):
-        glBindVertexArray(self.vertex_array_id)
-        glDrawElements(GL_TRIANGLES, len(self.indices), GL_UNSIGNED_INT, self.indices)
+def load_mesh(filename, parallel=False, optimize=False, vertex_format=None, lod=False):
+    def parse(name):
+        vertices, indices = parse_obj_parallel(name) if parallel else parse_obj(name)
+        if not optimize:
+            return vertices, indices
+        print_statistics("before optimization", indices, len(vertices) // 8)
+        vertices, indices = optimize_interleaved(vertices, indices, 8)
+        print_statistics("after optimization", indices, len(vertices) // 8)
+        return vertices, indices
 
+    variant = "optimized" if optimize else ""
+    vertices, indices, attributes = load_cached_mesh(filename, parse, (3, 3, 2), variant)
 
-def load_mesh(filename):
-    v = []
-    vn = []
-    vt = []
-    f = []
+    lods = None
+    if lod:
+        def build():
+            return build_lod_chain(vertices, indices, sum(attributes), LOD_TARGET_ERROR, LOD_COUNT, optimize)
+
+        indices, lods = load_cached_lods(filename, build, LOD_TARGET_ERROR, LOD_COUNT, variant)
+    return Mesh(vertices, indices, attributes, vertex_format, lods)
+
+
+def load_dequantization_to_shader(shader_program, mesh):
+    aabb_min, aabb_extent = mesh.aabb
+    glUniform3f(glGetUniformLocation(shader_program, "aabbMin"), *aabb_min)
+    glUniform3f(glGetUniformLocation(shader_program, "aabbExtent"), *aabb_extent)
+    octahedral_normals = mesh.vertex_format.attributes[1] is NORMAL_OCT16
+    glUniform1i(glGetUniformLocation(shader_program, "octahedralNormals"), octahedral_normals)
+
+
+def stream_mesh(filename):
+    mesh = Mesh([], [], (3, 3, 2))
+    mesh.bind_streaming_attributes()
+    return mesh, stream_cached_mesh(filename, iter_obj_chunks, mesh.attributes)
 
-    with open(filename) as file:
-        for line in file.readlines():
-            tokens = line.split()
-            if len(tokens) == 0:
-                continue
-            if tokens[0] == "v":
-                v.append(list(map(float, tokens[1:])))
-            elif tokens[0] == "vn":
-                vn.append(list(map(float, tokens[1:])))
-            elif tokens[0] == "vt":
-                vt.append(list(map(float, tokens[1:])))
-            elif tokens[0] == "f":
-                f.append(list(map(int, tokens[1:])))
-
-    vertices = []
-    for (pos, normal, texture) in zip(v, vn, vt):
-        vertices.extend(pos)
-        vertices.extend(normal)
-        vertices.extend(texture[:2])
-
-    indices = []
-    for face in f:
-        for vi in face:
-            indices.append(vi - 1)
-
-    return Mesh(vertices, indices, (3, 3, 2))
+
+def upload_image(img, flip=False):
+    # PIL's pixels in one contiguous copy, a negative raw encoder orientation emits the rows bottom-up;
+    # RGBA rows are always 4 byte aligned, which is the default unpack alignment
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE,
+                 img.tobytes("raw", "RGBA", 0, -1 if flip else 1))
 
 
 def load_texture(filepath):
     img = Image.open(filepath).convert("RGBA")
-    img = ImageOps.flip(img)
-    img_data = numpy.array(list(img.getdata()), numpy.uint8)
     tex_id = glGenTextures(1)
     glBindTexture(GL_TEXTURE_2D, tex_id)
     glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
+    upload_image(img, flip=True)
     glGenerateMipmap(GL_TEXTURE_2D)
     glBindTexture(GL_TEXTURE_2D, 0)
     return tex_id
@@ -199,14 +348,31 @@ def main():
     glEnable(GL_DEPTH_TEST)
     glEnable(GL_MULTISAMPLE)
 
-    mesh = load_mesh("../cottage.obj")
-    mesh.bind_attributes()
-    texture = load_texture("../cottage.png")
+    if COMPACT_VERTICES or LOD_SCENE:
+        mesh = load_mesh("../cottage.obj", vertex_format=COMPACT_FORMAT if COMPACT_VERTICES else None, lod=LOD_SCENE)
+        mesh.bind_attributes()
+        mesh_chunks = iter(())
+    else:
+        mesh, mesh_chunks = stream_mesh("../cottage.obj")
+
+    if COMPACT_VERTICES:
+        shader_program = build_shader("obj_files_compact", "obj_files")
+    else:
+        shader_program = build_shader("obj_files")
+
+    if LOD_SCENE:
+        models = [glm.translate(glm.vec3(x * LOD_SCENE_SPACING, 0, z * LOD_SCENE_SPACING))
+                  for x in range(LOD_SCENE_SIZE) for z in range(LOD_SCENE_SIZE)]
+    else:
+        models = [glm.mat4()]
 
-    shader_program = build_shader("obj_files")
+    texture = load_texture("../cottage.png")
 
     glUseProgram(shader_program)
 
+    if COMPACT_VERTICES:
+        load_dequantization_to_shader(shader_program, mesh)
+
     glfw.set_window_size_callback(window, lambda _, w, h: resize(w, h, shader_program))
 
     resize(width, height, shader_program)
@@ -218,6 +384,10 @@ def main():
     while not glfw.window_should_close(window):
         glfw.poll_events()
 
+        chunk = next(mesh_chunks, None)
+        if chunk is not None:
+            mesh.append(*chunk)
+
         cur_time = glfw.get_time()
         delta_time = cur_time - prev_time
         prev_time = cur_time
@@ -258,10 +428,14 @@ def main():
 
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-        model = glm.mat4()
-        load_matrix_to_shader(shader_program, model, "model")
         glBindTexture(GL_TEXTURE_2D, texture)
-        mesh.draw()
+        triangles = 0
+        for model in models:
+            load_matrix_to_shader(shader_program, model, "model")
+            triangles += mesh.draw(camera, model)
+
+        if LOD_SCENE:
+            glfw.set_window_title(window, f"Obj files - {triangles} triangles")
 
         glfw.swap_buffers(window)
 
@@ -0,0 +1,364 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy
+
+NEWLINE = ord("\n")
+POINT = ord(".")
+SPACE = ord(" ")
+TAB = ord("\t")
+
+OTHER, POSITION, NORMAL, TEXTURE, FACE = range(5)
+
+# line kind -> length of the keyword that starts the line
+PREFIX_LENGTHS = {POSITION: 1, NORMAL: 2, TEXTURE: 2, FACE: 1}
+
+# above this many runs of one line kind a byte mask is cheaper than joining the runs
+MAX_RUNS = 4096
+
+CHUNK_SIZE = 4 << 20
+
+# bytes tokenized at once, small enough for the intermediate arrays to stay in the cache
+BLOCK_SIZE = 1 << 19
+
+# blank bytes around the text while it is tokenized, a word can be read before or after any byte of it
+PADDING = 8
+
+ASCII_ZEROS = numpy.uint64(0x3030303030303030)
+LOW_BITS = numpy.uint64(0x7F7F7F7F7F7F7F7F)
+HIGH_BITS = numpy.uint64(0x8080808080808080)
+DIGIT_LIMIT = numpy.uint64(0x7676767676767676)
+POWERS_OF_TEN = 10 ** numpy.arange(8, dtype=numpy.uint64)
+
+# smallest byte range worth handing to a separate process
+MIN_RANGE_SIZE = 8 << 20
+
+
+def line_starts(buf):
+    return numpy.concatenate(([PADDING], numpy.flatnonzero(buf[PADDING:-PADDING] == NEWLINE) + PADDING + 1))
+
+
+def classify_lines(buf, starts):
+    first = buf[starts]
+    second = buf[starts + 1]
+    third = buf[starts + 2]
+
+    second_is_space = (second == SPACE) | (second == TAB)
+    third_is_space = (third == SPACE) | (third == TAB)
+
+    kinds = numpy.full(len(starts), OTHER, numpy.uint8)
+    kinds[(first == ord("v")) & second_is_space] = POSITION
+    kinds[(first == ord("v")) & (second == ord("n")) & third_is_space] = NORMAL
+    kinds[(first == ord("v")) & (second == ord("t")) & third_is_space] = TEXTURE
+    kinds[(first == ord("f")) & second_is_space] = FACE
+    return kinds
+
+
+# components used per record kind, a file without records of a kind gives an empty array of this width
+COMPONENTS = {"v": 3, "vn": 3, "vt": 2}
+
+
+def reshape_records(values, count, name):
+    if count == 0:
+        return numpy.empty((0, COMPONENTS[name]), values.dtype)
+    if len(values) % count != 0:
+        raise ValueError(f"Inconsistent number of components in '{name}' records")
+    return values.reshape(count, len(values) // count)
+
+
+# Numbers are converted 8 characters at a time: every byte of buf starts an unaligned little-endian word,
+# so the first character of a word is its lowest byte.
+def word_view(buf):
+    return numpy.ndarray((len(buf) - 7,), "<u8", buf, 0, (1,))
+
+
+def non_digit_bytes(words):
+    # bit 7 of every byte that is not an ASCII digit
+    shifted = words ^ ASCII_ZEROS
+    return (((shifted & LOW_BITS) + DIGIT_LIMIT) | shifted) & HIGH_BITS
+
+
+def highest_bit(words):
+    # read from the exponent of the nearest double, exact for masks with at most one bit per byte
+    return (words.astype(numpy.float64).view(numpy.uint64) >> numpy.uint64(52)) - numpy.uint64(1023)
+
+
+def keep_high_bytes(words, shifts):
+    # keeps the bytes from bit shifts up, the ones below become zero bytes, which digit_values reads as "0"
+    return words >> shifts << shifts
+
+
+def digit_values(words):
+    # eight ASCII digits to their value, combining pairs of digits, then pairs of pairs, then the two halves
+    words = (words & numpy.uint64(0x0F0F0F0F0F0F0F0F)) * numpy.uint64(2561) >> numpy.uint64(8)
+    words = (words & numpy.uint64(0x00FF00FF00FF00FF)) * numpy.uint64(6553601) >> numpy.uint64(16)
+    return (words & numpy.uint64(0x0000FFFF0000FFFF)) * numpy.uint64(42949672960001) >> numpy.uint64(32)
+
+
+def blank_bytes(buf, ranges):
+    return sum(int(numpy.count_nonzero(buf[start:stop] <= SPACE)) for start, stop in ranges)
+
+
+# Numbers written as [-]digits.digits with at most 7 digits on either side of the point, found from their points.
+# The integer digits end at the highest non-digit byte of the word before the point, the fraction digits at the
+# lowest non-digit byte of the word after it. Returns None for anything else (exponents, numbers without a point,
+# stray characters), the caller then falls back to numpy.fromstring.
+def parse_decimals(buf, points, ranges):
+    bounds = numpy.searchsorted(points, ranges).tolist()
+    points = numpy.concatenate([points[start:stop] for start, stop in bounds] or [points[:0]])
+    words = word_view(buf)
+    before = words[points - 8]
+    after = words[points + 1]
+    before_mask = non_digit_bytes(before)
+    after_mask = non_digit_bytes(after)
+    if not (before_mask.all() and after_mask.all()):
+        return None
+
+    # x & -x keeps the lowest set bit of x
+    integer_shifts = highest_bit(before_mask) + numpy.uint64(1)
+    fraction_bits = highest_bit(after_mask & -after_mask) - numpy.uint64(7)
+    negative = (before >> (integer_shifts - numpy.uint64(8))) & numpy.uint64(0xFF) == ord("-")
+    integer_lengths = ((numpy.uint64(64) - integer_shifts) >> numpy.uint64(3)).view(numpy.int64)
+    fraction_lengths = (fraction_bits >> numpy.uint64(3)).view(numpy.int64)
+
+    # numbers that do not touch each other and together with the blanks make up all of the bytes are whole tokens
+    starts = points - integer_lengths - negative
+    ends = points + 1 + fraction_lengths
+    if not ((integer_lengths | fraction_lengths).all() and (starts[1:] > ends[:-1]).all()) \
+            or int((ends - starts).sum()) + blank_bytes(buf, ranges) != sum(stop - start for start, stop in ranges):
+        return None
+
+    fraction = after << (numpy.uint64(64) - fraction_bits)
+    scales = POWERS_OF_TEN[fraction_lengths]
+    if (integer_lengths + fraction_lengths).max(initial=0) <= 8:
+        # all digits fit one word, the integer digits go right below the fraction digits
+        mantissas = digit_values(keep_high_bytes(before, integer_shifts) >> fraction_bits | fraction)
+    else:
+        mantissas = digit_values(keep_high_bytes(before, integer_shifts)) * scales + digit_values(fraction)
+    # the mantissa and the power of ten are exact doubles, so the division is correctly rounded, like in strtod
+    values = mantissas.astype(numpy.float64)
+    values /= scales
+    values.view(numpy.uint64)[...] |= negative.astype(numpy.uint64) << numpy.uint64(63)
+    return values.astype(numpy.float32)
+
+
+def tokenize(buf):
+    # one copy with blank bytes around the contents, so that lines and words can be read past both ends
+    padded = numpy.full(len(buf) + 2 * PADDING, SPACE, numpy.uint8)
+    padded[PADDING:-PADDING] = buf
+    starts = line_starts(padded)
+    kinds = classify_lines(padded, starts)
+
+    # blank out keywords so that each kind becomes a plain whitespace separated list of numbers
+    for kind, prefix_length in PREFIX_LENGTHS.items():
+        kind_starts = starts[kinds == kind]
+        for i in range(prefix_length):
+            padded[kind_starts + i] = SPACE
+
+    # lines of one kind usually come in long runs, so the data of each kind is gathered run by run
+    run_starts = numpy.concatenate(([0], numpy.flatnonzero(kinds[1:] != kinds[:-1]) + 1))
+    run_kinds = kinds[run_starts]
+    run_bounds = numpy.append(starts[run_starts], len(padded) - PADDING).tolist()
+    points = numpy.flatnonzero(padded == POINT)
+    data = padded.data
+    byte_kinds = None
+
+    def values(kind, dtype):
+        nonlocal byte_kinds
+        (runs,) = numpy.nonzero(run_kinds == kind)
+        if len(runs) <= MAX_RUNS:
+            ranges = [(run_bounds[run], run_bounds[run + 1]) for run in runs.tolist()]
+            if dtype == numpy.float32:
+                parsed = parse_decimals(padded, points, ranges)
+                if parsed is not None:
+                    return parsed
+            text = b"".join(data[start:stop] for start, stop in ranges)
+        else:
+            if byte_kinds is None:
+                byte_kinds = numpy.repeat(kinds, numpy.diff(numpy.append(starts, len(padded) - PADDING)))
+            text = padded[PADDING:-PADDING][byte_kinds == kind].tobytes()
+        return numpy.fromstring(text, dtype=dtype, sep=" ")
+
+    return (
+        reshape_records(values(POSITION, numpy.float32), numpy.count_nonzero(kinds == POSITION), "v"),
+        reshape_records(values(NORMAL, numpy.float32), numpy.count_nonzero(kinds == NORMAL), "vn"),
+        reshape_records(values(TEXTURE, numpy.float32), numpy.count_nonzero(kinds == TEXTURE), "vt"),
+        values(FACE, numpy.uint32),
+    )
+
+
+def line_end(buf, position):
+    # index just past the end of the line that position falls into
+    while position < len(buf):
+        window = buf[position:position + 4096]
+        (newlines,) = numpy.nonzero(window == NEWLINE)
+        if len(newlines) > 0:
+            return position + int(newlines[0]) + 1
+        position += len(window)
+    return len(buf)
+
+
+def tokenize_blocks(buf, block_size=BLOCK_SIZE):
+    # a block of whole lines at a time, so that the intermediate arrays stay in the cache
+    bounds = [0]
+    while len(buf) - bounds[-1] > block_size:
+        bounds.append(line_end(buf, bounds[-1] + block_size))
+    bounds.append(len(buf))
+    v, vn, vt, f = zip(*(tokenize(buf[start:stop]) for start, stop in zip(bounds, bounds[1:])))
+    return merge_records(v, "v"), merge_records(vn, "vn"), merge_records(vt, "vt"), numpy.concatenate(f)
+
+
+def interleave(v, vn, vt):
+    count = min(len(v), len(vn), len(vt))
+    vertices = numpy.empty((count, 8), numpy.float32)
+    vertices[:, 0:3] = v[:count, :3]
+    vertices[:, 3:6] = vn[:count, :3]
+    vertices[:, 6:8] = vt[:count, :2]
+    return vertices.reshape(-1)
+
+
+def build_buffers(v, vn, vt, f):
+    return interleave(v, vn, vt), f - 1
+
+
+def parse_obj(filename):
+    return build_buffers(*tokenize_blocks(numpy.fromfile(filename, numpy.uint8)))
+
+
+def split_ranges(filename, count):
+    size = os.path.getsize(filename)
+    bounds = [0]
+    with open(filename, "rb") as file:
+        for i in range(1, count):
+            position = max(size * i // count, bounds[-1])
+            file.seek(position)
+            # move the bound past the end of the line it falls into
+            while True:
+                block = file.read(1 << 16)
+                newline = block.find(b"\n")
+                if newline >= 0 or not block:
+                    position = position + newline + 1 if newline >= 0 else size
+                    break
+                position += len(block)
+            bounds.append(position)
+    bounds.append(size)
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if start < stop]
+
+
+def parse_range(filename, start, stop):
+    arrays = tokenize_blocks(numpy.fromfile(filename, numpy.uint8, stop - start, offset=start))
+
+    # results are handed back through shared memory, only its name and the array layout are pickled
+    memory = SharedMemory(create=True, size=max(1, sum(array.nbytes for array in arrays)))
+    layout = []
+    offset = 0
+    for array in arrays:
+        numpy.ndarray(array.shape, array.dtype, memory.buf, offset)[...] = array
+        layout.append((array.shape, array.dtype.str, offset))
+        offset += array.nbytes
+    memory.close()
+    # the block is unlinked by the parent process once it has been collected
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return memory.name, layout
+
+
+def collect_range(name, layout):
+    memory = SharedMemory(name)
+    try:
+        return [numpy.ndarray(shape, dtype, memory.buf, offset).copy() for shape, dtype, offset in layout]
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def merge_records(parts, name):
+    parts = [part for part in parts if len(part) > 0]
+    if not parts:
+        return numpy.empty((0, COMPONENTS[name]), numpy.float32)
+    if len({part.shape[1] for part in parts}) > 1:
+        raise ValueError(f"Inconsistent number of components in '{name}' records")
+    return numpy.concatenate(parts)
+
+
+def parse_obj_parallel(filename, workers=None):
+    workers = workers or os.cpu_count()
+    ranges = split_ranges(filename, max(1, min(workers, os.path.getsize(filename) // MIN_RANGE_SIZE)))
+    if len(ranges) <= 1:
+        return parse_obj(filename)
+
+    with ProcessPoolExecutor(len(ranges)) as executor:
+        futures = [executor.submit(parse_range, filename, start, stop) for start, stop in ranges]
+        results = [collect_range(*future.result()) for future in futures]
+
+    # face indices in OBJ are absolute, so concatenating the ranges in file order keeps them valid
+    v, vn, vt, f = zip(*results)
+    return build_buffers(merge_records(v, "v"), merge_records(vn, "vn"), merge_records(vt, "vt"), numpy.concatenate(f))
+
+
+class RecordQueue:
+    def __init__(self):
+        self.parts = []
+        self.count = 0
+
+    def push(self, records):
+        if len(records) > 0:
+            self.parts.append(records)
+            self.count += len(records)
+
+    def pop(self, count):
+        taken = []
+        while count > 0:
+            part = self.parts[0]
+            taken.append(part[:count])
+            if len(part) <= count:
+                self.parts.pop(0)
+            else:
+                self.parts[0] = part[count:]
+            self.count -= len(taken[-1])
+            count -= len(taken[-1])
+        return numpy.concatenate(taken) if taken else numpy.empty((0, 3), numpy.float32)
+
+
+def iter_obj_chunks(filename, chunk_size=CHUNK_SIZE):
+    v, vn, vt = RecordQueue(), RecordQueue(), RecordQueue()
+    faces = numpy.empty(0, numpy.uint32)
+    vertex_count = 0
+
+    with open(filename, "rb") as file:
+        tail = b""
+        while True:
+            chunk = file.read(chunk_size)
+            at_end = len(chunk) == 0
+            if at_end:
+                text, tail = tail, b""
+            else:
+                # only complete lines are parsed, the rest is carried over to the next chunk
+                split = chunk.rfind(b"\n") + 1
+                if split == 0:
+                    tail += chunk
+                    continue
+                text, tail = tail + chunk[:split], chunk[split:]
+
+            chunk_v, chunk_vn, chunk_vt, chunk_f = tokenize(numpy.frombuffer(text, numpy.uint8))
+            v.push(chunk_v)
+            vn.push(chunk_vn)
+            vt.push(chunk_vt)
+            faces = numpy.concatenate((faces, chunk_f - 1))
+
+            count = min(v.count, vn.count, vt.count)
+            vertices = interleave(v.pop(count), vn.pop(count), vt.pop(count))
+            vertex_count += count
+
+            # faces are released in whole triangles once all their vertices have been released
+            ready = len(faces) if at_end else len(faces) // 3 * 3
+            pending = numpy.flatnonzero(faces[:ready] >= vertex_count)
+            if len(pending) > 0 and not at_end:
+                ready = pending[0] // 3 * 3
+            indices, faces = faces[:ready], faces[ready:]
+
+            if len(vertices) > 0 or len(indices) > 0:
+                yield vertices, indices
+            if at_end:
+                return
@@ -0,0 +1,119 @@
+from ctypes import c_void_p
+
+import numpy
+from OpenGL.GL import GL_FALSE, GL_FLOAT, GL_HALF_FLOAT, GL_INT_2_10_10_10_REV, GL_SHORT, GL_TRUE, \
+    GL_UNSIGNED_SHORT, glEnableVertexAttribArray, glVertexAttribPointer
+
+# attributes start at multiples of this many bytes inside a vertex
+ATTRIBUTE_ALIGNMENT = 4
+
+
+def pack_floats(values, aabb):
+    return values.astype(numpy.float32)
+
+
+def pack_half_floats(values, aabb):
+    return values.astype(numpy.float16)
+
+
+def pack_unorm16_positions(values, aabb):
+    # positions are stored relative to the bounding box, the shader maps them back with aabbMin + v * aabbExtent
+    low, extent = aabb
+    normalized = (values[:, :3] - low) / numpy.where(extent > 0, extent, 1)
+    packed = numpy.zeros((len(values), 4), numpy.uint16)
+    packed[:, :3] = numpy.round(numpy.clip(normalized, 0, 1) * 65535)
+    return packed
+
+
+def octahedral_encode(normals):
+    normals = normals[:, :3] / numpy.maximum(numpy.abs(normals[:, :3]).sum(axis=1), 1e-20)[:, None]
+    encoded = normals[:, :2].copy()
+    lower = normals[:, 2] < 0
+    signs = numpy.where(encoded[lower] >= 0, 1.0, -1.0)
+    encoded[lower] = (1 - numpy.abs(encoded[lower][:, ::-1])) * signs
+    return encoded
+
+
+def pack_oct16_normals(values, aabb):
+    return numpy.round(numpy.clip(octahedral_encode(values), -1, 1) * 32767).astype(numpy.int16)
+
+
+def pack_10_10_10_2_normals(values, aabb):
+    normals = values[:, :3] / numpy.maximum(numpy.linalg.norm(values[:, :3], axis=1), 1e-20)[:, None]
+    components = numpy.round(numpy.clip(normals, -1, 1) * 511).astype(numpy.int32) & 0x3FF
+    return (components[:, 0] | components[:, 1] << 10 | components[:, 2] << 20).astype(numpy.uint32)
+
+
+class VertexAttribute:
+    def __init__(self, components, gl_type, normalized, dtype, pack):
+        self.components = components
+        self.gl_type = gl_type
+        self.normalized = normalized
+        self.dtype = numpy.dtype(dtype)
+        self.pack = pack
+
+
+def float_attribute(components):
+    return VertexAttribute(components, GL_FLOAT, GL_FALSE, (numpy.float32, components), pack_floats)
+
+
+POSITION_UNORM16 = VertexAttribute(4, GL_UNSIGNED_SHORT, GL_TRUE, (numpy.uint16, 4), pack_unorm16_positions)
+NORMAL_OCT16 = VertexAttribute(2, GL_SHORT, GL_TRUE, (numpy.int16, 2), pack_oct16_normals)
+NORMAL_10_10_10_2 = VertexAttribute(4, GL_INT_2_10_10_10_REV, GL_TRUE, numpy.uint32, pack_10_10_10_2_normals)
+UV_HALF = VertexAttribute(2, GL_HALF_FLOAT, GL_FALSE, (numpy.float16, 2), pack_half_floats)
+
+
+class VertexFormat:
+    def __init__(self, attributes):
+        self.attributes = attributes
+        offsets = []
+        offset = 0
+        for attribute in attributes:
+            offsets.append(offset)
+            offset += -(-attribute.dtype.itemsize // ATTRIBUTE_ALIGNMENT) * ATTRIBUTE_ALIGNMENT
+        self.dtype = numpy.dtype({
+            "names": [f"a{i}" for i in range(len(attributes))],
+            "formats": [attribute.dtype for attribute in attributes],
+            "offsets": offsets,
+            "itemsize": offset,
+        })
+        self.offsets = offsets
+        self.stride = offset
+
+    def is_float(self):
+        return all(attribute.pack is pack_floats for attribute in self.attributes)
+
+    # vertices is an (n, sum(sizes)) float array where sizes are the source component counts of the attributes
+    def pack(self, vertices, sizes, aabb=None):
+        vertices = numpy.asarray(vertices, numpy.float32).reshape(-1, sum(sizes))
+        if self.is_float():
+            return numpy.ascontiguousarray(vertices)
+
+        packed = numpy.zeros(len(vertices), self.dtype)
+        start = 0
+        for i, (attribute, size) in enumerate(zip(self.attributes, sizes)):
+            packed[f"a{i}"] = attribute.pack(vertices[:, start:start + size], aabb)
+            start += size
+        return packed
+
+    def set_attribute_pointers(self):
+        for i, (attribute, offset) in enumerate(zip(self.attributes, self.offsets)):
+            glVertexAttribPointer(i, attribute.components, attribute.gl_type, attribute.normalized, self.stride,
+                                  c_void_p(offset))
+            glEnableVertexAttribArray(i)
+
+
+def float_format(sizes):
+    return VertexFormat([float_attribute(size) for size in sizes])
+
+
+def position_bounds(vertices, sizes):
+    positions = numpy.asarray(vertices, numpy.float32).reshape(-1, sum(sizes))[:, :3]
+    if len(positions) == 0:
+        return numpy.zeros(3, numpy.float32), numpy.ones(3, numpy.float32)
+    low = positions.min(axis=0)
+    return low, positions.max(axis=0) - low
+
+
+COMPACT_FORMAT = VertexFormat([POSITION_UNORM16, NORMAL_OCT16, UV_HALF])
+COMPACT_10_10_10_2_FORMAT = VertexFormat([POSITION_UNORM16, NORMAL_10_10_10_2, UV_HALF])
@@ -115,6 +115,20 @@ def resize(width, height, shader_program):
         glViewport(0, 0, width, height)
 
 
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    glBufferData(target, data.nbytes, data, usage)
+
+
 class Mesh:
     def __init__(self, vertices, indices, attributes):
         self.vertices = vertices
@@ -123,11 +137,10 @@ class Mesh:
         self.vertex_array_id = None
 
     def bind_attributes(self):
-        vertices = (GLfloat * len(self.vertices))(*self.vertices)
         self.vertex_array_id = glGenVertexArrays(1)
         glBindVertexArray(self.vertex_array_id)
         glBindBuffer(GL_ARRAY_BUFFER, glGenBuffers(1))
-        glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), vertices, GL_STATIC_DRAW)
+        upload_buffer(GL_ARRAY_BUFFER, self.vertices)
 
         vertex_size = sum(self.attributes)
         offset = 0
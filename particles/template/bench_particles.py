@@ -0,0 +1,31 @@
+import sys
+import time
+
+import numpy
+
+from particles_template import ParticleSystem
+
+COUNTS = [10 ** 4, 10 ** 5, 10 ** 6]
+# long enough for the pool to fill up and the first particles to die
+FRAMES = 300
+DELTA_TIME = 1 / 60
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or COUNTS
+    for count in counts:
+        particles = ParticleSystem(count, seed=0)
+        times = []
+        for _ in range(FRAMES):
+            start = time.perf_counter()
+            particles.update(DELTA_TIME)
+            times.append(time.perf_counter() - start)
+        # the buffer copied into the instance stream is the state array itself
+        assert particles.instances.flags.c_contiguous
+        mean = numpy.mean(times)
+        print(f"{count:9} particles  {particles.alive_count:9} alive  update {mean * 1000:7.2f} ms on average, {max(times) * 1000:7.2f} ms at most"
+              f"   {1 / mean:8.0f} updates/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,10 @@
+import ctypes
 import math
-import random
 import time
 from ctypes import sizeof, c_void_p
 
 import glfw
 import numpy
-import numpy as np
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 from PIL import Image
@@ -13,6 +12,18 @@ from PIL import Image
 width = 800
 height = 800
 PARTICLES_NUM = 2000
+MAX_TTL = 4
+MEAN_TTL = MAX_TTL * 3 / 4
+GRAVITY = 1.5
+MIN_SPEED = 0.5
+MAX_SPEED = 1.5
+MIN_SIZE = 0.01
+MAX_SIZE = 0.04
+# x, y, size, r, g, b, a per instance
+INSTANCE_FLOATS = 7
+STREAM_REGIONS = 3
+PERSISTENT_FLAGS = GL_MAP_WRITE_BIT | GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT
+FENCE_TIMEOUT = 10 ** 9
 
 
 def read_shader_file(filename):
@@ -22,14 +33,13 @@ def read_shader_file(filename):
 
 def load_texture(filepath):
     img = Image.open(filepath).convert("RGBA")
-    img_data = numpy.array(list(img.getdata()), numpy.uint8)
     tex_id = glGenTextures(1)
     glBindTexture(GL_TEXTURE_2D, tex_id)
     glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_MIRRORED_REPEAT)
     glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_MIRRORED_REPEAT)
     glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
     glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img.tobytes())
     glGenerateMipmap(GL_TEXTURE_2D)
     glBindTexture(GL_TEXTURE_2D, 0)
     return tex_id
@@ -74,28 +84,182 @@ def resize(w, h):
         glViewport(0, 0, width, height)
 
 
-class Particle:
-    def __init__(self, ttl):
-        self.pos = (0, 0)
-        self.v = (0, 0)
-        self.color = (0, 0, 0, 0)
-        self.ttl = ttl
-        self.size = 0
-
-
-def get_pos_and_size_data(particles):
-    return numpy.array([x for p in particles for x in p.pos + (p.size,)], dtype='float32')
-
-
-def get_color_data(particles):
-    return numpy.array([x for p in particles for x in p.color], dtype='float32')
-
-
-def float_array(data):
-    return np.array(data, dtype=np.float32)
-
-
-def init_buffers(vertex_buffer, pos_buffer, color_buffer):
+class Emitter:
+    # emits rate particles per second from position, in directions between the two angles
+    def __init__(self, rate, position=(0, 0), angles=(math.pi / 3, 2 * math.pi / 3)):
+        self.rate = rate
+        self.position = position
+        self.angles = angles
+        self.pending = 0
+
+    def emit_count(self, delta_time):
+        # the fractional part is carried over, so low rates still emit on average
+        self.pending += self.rate * delta_time
+        count = int(self.pending)
+        self.pending -= count
+        return count
+
+
+class ParticleSystem:
+    # one float32 array per attribute instead of one object per particle, every update is a handful of array
+    # operations; the rendered attributes live interleaved in instances, which is uploaded as it is.
+    # The alive particles are kept at the front of the arrays, so updates and draws only touch alive_count of them:
+    # the dead are swap-removed and emitters take the slots right after the alive ones
+    def __init__(self, count, emitters=None, seed=None):
+        self.count = count
+        self.emitters = [Emitter(count / MEAN_TTL)] if emitters is None else emitters
+        self.rng = numpy.random.default_rng(seed)
+        self.alive_count = 0
+        self.dropped = 0
+        # x, y, size, r, g, b, a per particle, the attribute arrays are views into it
+        self.instances = numpy.zeros((count, INSTANCE_FLOATS), numpy.float32)
+        self.pos_size = self.instances[:, :3]
+        self.pos = self.instances[:, :2]
+        self.size = self.instances[:, 2]
+        self.color = self.instances[:, 3:]
+        self.velocity = numpy.zeros((count, 2), numpy.float32)
+        self.ttl = numpy.zeros(count, numpy.float32)
+        # preallocated temporary of the integration step
+        self.step = numpy.empty((count, 2), numpy.float32)
+
+    def emit(self, emitter, n):
+        # 3. Setup new particle parameters
+        n = min(n, self.count - self.alive_count)
+        if n == 0:
+            return
+        new = slice(self.alive_count, self.alive_count + n)
+        angle = self.rng.uniform(*emitter.angles, n).astype(numpy.float32)
+        speed = self.rng.uniform(MIN_SPEED, MAX_SPEED, n).astype(numpy.float32)
+        self.pos[new] = emitter.position
+        self.velocity[new, 0] = numpy.cos(angle) * speed
+        self.velocity[new, 1] = numpy.sin(angle) * speed
+        self.size[new] = self.rng.uniform(MIN_SIZE, MAX_SIZE, n)
+        self.color[new, :3] = self.rng.random((n, 3), numpy.float32)
+        self.ttl[new] = self.rng.uniform(MAX_TTL / 2, MAX_TTL, n)
+        self.alive_count += n
+
+    def remove_dead(self):
+        alive = self.alive_count
+        dead = numpy.flatnonzero(self.ttl[:alive] <= 0)
+        if len(dead) == 0:
+            return
+        # the holes left before the new end are filled with the survivors from behind it
+        end = alive - len(dead)
+        holes = dead[dead < end]
+        survivors = end + numpy.flatnonzero(self.ttl[end:alive] > 0)
+        for array in (self.instances, self.velocity, self.ttl):
+            array[holes] = array[survivors]
+        self.alive_count = end
+
+    def update(self, delta_time):
+        # 3. Update particle
+        self.ttl[:self.alive_count] -= delta_time
+        self.remove_dead()
+
+        alive = self.alive_count
+        self.velocity[:alive, 1] -= GRAVITY * delta_time
+        numpy.multiply(self.velocity[:alive], delta_time, out=self.step[:alive])
+        self.pos[:alive] += self.step[:alive]
+        # fades out over the last second of its life
+        numpy.clip(self.ttl[:alive], 0, 1, out=self.color[:alive, 3])
+
+        for emitter in self.emitters:
+            n = emitter.emit_count(delta_time)
+            self.dropped += max(0, n - (self.count - self.alive_count))
+            self.emit(emitter, n)
+
+
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    glBufferData(target, data.nbytes, data, usage)
+
+
+def buffer_storage_supported():
+    # glBufferStorage is core since 4.4
+    return (glGetIntegerv(GL_MAJOR_VERSION), glGetIntegerv(GL_MINOR_VERSION)) >= (4, 4)
+
+
+class InstanceStream:
+    # the instance buffer is allocated once and split into regions used round-robin, each guarded by a fence
+    # of the draw that read it, so the CPU writes the next frame while the GPU still draws the previous one;
+    # without GL 4.4 there is a single region whose storage is orphaned every frame instead
+    def __init__(self, count, regions=STREAM_REGIONS, persistent=None):
+        self.count = count
+        self.region_size = count * INSTANCE_FLOATS * sizeof(GLfloat)
+        self.persistent = buffer_storage_supported() if persistent is None else persistent
+        self.regions = regions if self.persistent else 1
+        self.fences = [None] * self.regions
+        self.current = 0
+        self.buffer_id = glGenBuffers(1)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer_id)
+        if self.persistent:
+            size = self.regions * self.region_size
+            glBufferStorage(GL_ARRAY_BUFFER, size, None, PERSISTENT_FLAGS)
+            address = ctypes.cast(glMapBufferRange(GL_ARRAY_BUFFER, 0, size, PERSISTENT_FLAGS), c_void_p).value
+            # stays mapped for the lifetime of the stream, frames are copied straight into these views
+            mapped = numpy.ctypeslib.as_array((ctypes.c_float * (size // sizeof(GLfloat))).from_address(address))
+            self.mapped = mapped.reshape(self.regions, count, INSTANCE_FLOATS)
+        else:
+            glBufferData(GL_ARRAY_BUFFER, self.region_size, None, GL_STREAM_DRAW)
+            self.mapped = None
+
+    def bind_attributes(self, pos_size_location, color_location):
+        glBindBuffer(GL_ARRAY_BUFFER, self.buffer_id)
+        stride = INSTANCE_FLOATS * sizeof(GLfloat)
+        glEnableVertexAttribArray(pos_size_location)
+        glVertexAttribPointer(pos_size_location, 3, GL_FLOAT, GL_FALSE, stride, c_void_p(0))
+        glEnableVertexAttribArray(color_location)
+        glVertexAttribPointer(color_location, 4, GL_FLOAT, GL_FALSE, stride, c_void_p(3 * sizeof(GLfloat)))
+        glVertexAttribDivisor(pos_size_location, 1)
+        glVertexAttribDivisor(color_location, 1)
+
+    def write(self, instances):
+        self.current = (self.current + 1) % self.regions
+        if self.persistent:
+            fence = self.fences[self.current]
+            if fence is not None:
+                glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, FENCE_TIMEOUT)
+                glDeleteSync(fence)
+                self.fences[self.current] = None
+            self.mapped[self.current, :len(instances)] = instances
+        else:
+            data = numpy.ascontiguousarray(instances, numpy.float32)
+            glBindBuffer(GL_ARRAY_BUFFER, self.buffer_id)
+            # a fresh allocation, the driver does not have to wait until the previous frame is drawn
+            glBufferData(GL_ARRAY_BUFFER, self.region_size, None, GL_STREAM_DRAW)
+            glBufferSubData(GL_ARRAY_BUFFER, 0, data.nbytes, data)
+
+    def draw(self, vertex_count, instance_count):
+        if self.persistent:
+            # the base instance selects the region, the attribute pointers stay the same
+            glDrawArraysInstancedBaseInstance(GL_TRIANGLES, 0, vertex_count, instance_count,
+                                              self.current * self.count)
+            self.fences[self.current] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        else:
+            glDrawArraysInstanced(GL_TRIANGLES, 0, vertex_count, instance_count)
+
+    def delete(self):
+        for fence in self.fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        if self.persistent:
+            self.mapped = None
+            glBindBuffer(GL_ARRAY_BUFFER, self.buffer_id)
+            glUnmapBuffer(GL_ARRAY_BUFFER)
+        glDeleteBuffers(1, [self.buffer_id])
+
+
+def init_buffers(vertex_buffer, instance_stream):
     vertices = [
         -1, -1,
         1, -1,
@@ -107,23 +271,13 @@ def init_buffers(vertex_buffer, pos_buffer, color_buffer):
 
     glBindVertexArray(glGenVertexArrays(1))
     glBindBuffer(GL_ARRAY_BUFFER, vertex_buffer)
-    glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), float_array(vertices), GL_STATIC_DRAW)
+    upload_buffer(GL_ARRAY_BUFFER, vertices)
     glEnableVertexAttribArray(0)
     glVertexAttribPointer(0, 2, GL_FLOAT, GL_FALSE, 2 * sizeof(GLfloat), c_void_p(0))
 
-    glBindBuffer(GL_ARRAY_BUFFER, pos_buffer)
-    glBufferData(GL_ARRAY_BUFFER, PARTICLES_NUM * 4 * sizeof(GLfloat), None, GL_STREAM_DRAW)
-    glEnableVertexAttribArray(1)
-    glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 3 * sizeof(GLfloat), c_void_p(0))
-
-    glBindBuffer(GL_ARRAY_BUFFER, color_buffer)
-    glBufferData(GL_ARRAY_BUFFER, PARTICLES_NUM * 4 * sizeof(GLfloat), None, GL_STREAM_DRAW)
-    glEnableVertexAttribArray(2)
-    glVertexAttribPointer(2, 4, GL_FLOAT, GL_FALSE, 4 * sizeof(GLfloat), c_void_p(0))
+    instance_stream.bind_attributes(1, 2)
 
     glVertexAttribDivisor(0, 0)
-    glVertexAttribDivisor(1, 1)
-    glVertexAttribDivisor(2, 1)
 
 
 def main():
@@ -133,15 +287,16 @@ def main():
     glEnable(GL_BLEND)
     glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
 
-    particles = [Particle(i / PARTICLES_NUM * 4) for i in range(PARTICLES_NUM)]
+    # two fountains sharing the pool, filling three quarters of it on average
+    particles = ParticleSystem(PARTICLES_NUM, [Emitter(PARTICLES_NUM / MEAN_TTL / 2, (-0.5, -0.8)),
+                                               Emitter(PARTICLES_NUM / MEAN_TTL / 4, (0.5, -0.8))])
 
     shader_program = build_shader("particles")
     glUseProgram(shader_program)
 
     vertex_buffer = glGenBuffers(1)
-    pos_buffer = glGenBuffers(1)
-    color_buffer = glGenBuffers(1)
-    init_buffers(vertex_buffer, pos_buffer, color_buffer)
+    instance_stream = InstanceStream(PARTICLES_NUM)
+    init_buffers(vertex_buffer, instance_stream)
 
     tex = load_texture("../texture/particle.png")
     glBindTexture(GL_TEXTURE_2D, tex)
@@ -158,23 +313,15 @@ def main():
         delta_time = cur_time - prev_time
         prev_time = cur_time
 
-        for particle in particles:
-            if particle.ttl <= 0:
-                ...  # 3. Setup new particle parameters
-            else:
-                ...  # 3. Update particle
+        particles.update(delta_time)
 
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-        glBindBuffer(GL_ARRAY_BUFFER, pos_buffer)
-        glBufferData(GL_ARRAY_BUFFER, len(particles) * 3 * sizeof(GLfloat), get_pos_and_size_data(particles), GL_STREAM_DRAW)
-
-        glBindBuffer(GL_ARRAY_BUFFER, color_buffer)
-        glBufferData(GL_ARRAY_BUFFER, len(particles) * 4 * sizeof(GLfloat), get_color_data(particles), GL_STREAM_DRAW)
-
-        glDrawArraysInstanced(GL_TRIANGLES, 0, 6, len(particles))
+        instance_stream.write(particles.instances[:particles.alive_count])
+        instance_stream.draw(6, particles.alive_count)
         glfw.swap_buffers(window)
 
+    instance_stream.delete()
     glfw.terminate()
 
 
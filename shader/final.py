@@ -1,6 +1,7 @@
 from math import sqrt
 from ctypes import sizeof, c_void_p
 
+import numpy
 import pygame
 from pygame.locals import DOUBLEBUF, OPENGL
 from OpenGL.GL import *
@@ -79,14 +80,26 @@ def main():
         pygame.time.wait(10)
 
 
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    glBufferData(target, data.nbytes, data, usage)
+
+
 def bind_vertices(shader_program, vertices):
-    # Convert vertex data to a format OpenGL understands
-    vertices = (GLfloat * len(vertices))(*vertices)
     # Bind the Vertex Array Object
     glBindVertexArray(glGenVertexArrays(1))
     # Bind the buffer and upload data
     glBindBuffer(GL_ARRAY_BUFFER, glGenBuffers(1))
-    glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), vertices, GL_STATIC_DRAW)
+    upload_buffer(GL_ARRAY_BUFFER, vertices)
     # Enable vertex pos attribute
     v_pos = glGetAttribLocation(shader_program, "vPos")
     glVertexAttribPointer(v_pos, 3, GL_FLOAT, GL_FALSE, 6 * sizeof(GLfloat), c_void_p(0))
@@ -0,0 +1,75 @@
+import sys
+import time
+
+import glfw
+import numpy
+from OpenGL.GL import *
+from PIL import Image, ImageOps
+
+from texture_final import init_glfw
+
+TEXTURES = ["../../camera/wood.png", "../gold.png", "../lake.png", "../canyon.jpg"]
+
+
+def legacy_image_data(img):
+    # the previous behaviour: one Python tuple per pixel
+    return numpy.array(list(img.getdata()), numpy.uint8)
+
+
+def image_data(img, flip=False):
+    # the bytes the lessons hand to GL, flipped rows as in obj_files_final
+    return numpy.frombuffer(img.tobytes("raw", "RGBA", 0, -1 if flip else 1), numpy.uint8)
+
+
+def upload_image(img):
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img.tobytes())
+
+
+def legacy_upload_image(img):
+    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE,
+                 legacy_image_data(img))
+
+
+def measure(upload, filepath, repeats):
+    # best of several runs of decode + conversion + glTexImage2D, waiting for the upload to finish
+    tex_id = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, tex_id)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        img = Image.open(filepath).convert("RGBA")
+        upload(img)
+        glFinish()
+        best = min(best, time.perf_counter() - start)
+    glDeleteTextures(1, [tex_id])
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    window = init_glfw(64, 64, "Texture load benchmark")
+    glfw.hide_window(window)
+
+    legacy_total = 0
+    total = 0
+    for filepath in TEXTURES:
+        img = Image.open(filepath).convert("RGBA")
+        assert numpy.array_equal(legacy_image_data(img).ravel(), image_data(img))
+        assert numpy.array_equal(image_data(ImageOps.flip(img)), image_data(img, flip=True))
+
+        legacy_time = measure(legacy_upload_image, filepath, repeats)
+        buffer_time = measure(upload_image, filepath, repeats)
+        legacy_total += legacy_time
+        total += buffer_time
+        print(f"{filepath:24} {img.width:5}x{img.height:<5} getdata: {legacy_time * 1000:9.2f} ms   "
+              f"tobytes: {buffer_time * 1000:8.2f} ms   {legacy_time / buffer_time:6.1f}x")
+
+    print(f"{'total':36} getdata: {legacy_total * 1000:9.2f} ms   tobytes: {total * 1000:8.2f} ms   "
+          f"{legacy_total / total:6.1f}x")
+
+    glfw.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+import time
+
+import glfw
+import numpy
+from PIL import Image
+
+from texture_final import init_glfw
+from texture_manager import TextureManager
+
+TEXTURE_COUNT = 48
+TEXTURE_SIZE = 512
+STEPS = 2000
+
+
+def write_synthetic_textures(directory):
+    rng = numpy.random.default_rng(0)
+    filepaths = []
+    for i in range(TEXTURE_COUNT):
+        filepath = os.path.join(directory, f"texture_{i}.png")
+        Image.fromarray(rng.integers(0, 256, (TEXTURE_SIZE, TEXTURE_SIZE, 4), numpy.uint8)).save(filepath)
+        filepaths.append(filepath)
+    return filepaths
+
+
+def browse(manager, filepaths):
+    # a random walk over the assets, each step shows one texture and lets go of the previous one
+    rng = numpy.random.default_rng(1)
+    position = 0
+    tex_id = None
+    times = {True: [], False: []}
+    for _ in range(STEPS):
+        position = (position + rng.choice([-1, 0, 1, 2])) % len(filepaths)
+        hits = manager.hits
+        start = time.perf_counter()
+        next_tex_id = manager.acquire(filepaths[position])
+        times[manager.hits > hits].append(time.perf_counter() - start)
+        if tex_id is not None:
+            manager.release(tex_id)
+        tex_id = next_tex_id
+    return times
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else 16
+
+    window = init_glfw(64, 64, "Texture manager benchmark")
+    glfw.hide_window(window)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepaths = write_synthetic_textures(directory)
+        # the first pass fills the texture cache on disk, so that the measured misses are reloads
+        warm_up = TextureManager(0)
+        for filepath in filepaths:
+            warm_up.release(warm_up.acquire(filepath))
+
+        manager = TextureManager(int(budget * 2 ** 20))
+        times = browse(manager, filepaths)
+        print(manager.report())
+        for hit, label in ((True, "hit"), (False, "miss")):
+            if times[hit]:
+                print(f"{label:5} {len(times[hit]):6} acquires, {numpy.mean(times[hit]) * 1000:8.3f} ms on average")
+        manager.clear()
+
+    glfw.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from mipmaps import FILTER_RADIUS, KAISER
+from texture_array import layer_size
+from texture_cache import BC1, FORMATS, level_size, load_texture_levels, mip_sizes
+
+TEXTURES = ["../../camera/wood.png", "../gold.png", "../lake.png", "../canyon.jpg"]
+
+
+def build(filepath, texture_format, mip_filter, size):
+    # runs in a worker process, nothing here needs a GL context
+    start = time.perf_counter()
+    texture = load_texture_levels(filepath, texture_format, size=size, mip_filter=mip_filter)
+    return time.perf_counter() - start, texture.levels
+
+
+def check_levels(texture_format, levels):
+    # the chain goes down to 1x1 with the sizes OpenGL expects, stored back to back
+    width, height = levels[0][2], levels[0][3]
+    assert [(level_width, level_height) for _, _, level_width, level_height in levels] == mip_sizes(width, height)
+    offset = 0
+    for level_offset, size, level_width, level_height in levels:
+        assert level_offset == offset
+        assert size == level_size(texture_format, level_width, level_height)
+        offset += size
+
+
+def main():
+    texture_format = sys.argv[1] if len(sys.argv) > 1 else BC1
+    mip_filter = sys.argv[2] if len(sys.argv) > 2 else KAISER
+    filepaths = sys.argv[3:] or TEXTURES
+    if texture_format not in FORMATS or mip_filter not in FILTER_RADIUS:
+        print(f"usage: {sys.argv[0]} [{'|'.join(FORMATS)}] [{'|'.join(FILTER_RADIUS)}] [image ...]")
+        exit(1)
+
+    # the lesson loads the images as layers of one texture array, so they are cached at the array's layer size
+    size = layer_size(filepaths)
+    start = time.perf_counter()
+    with ProcessPoolExecutor() as executor:
+        futures = [executor.submit(build, filepath, texture_format, mip_filter, size) for filepath in filepaths]
+        for filepath, future in zip(filepaths, futures):
+            elapsed, levels = future.result()
+            check_levels(texture_format, levels)
+            size = sum(level[1] for level in levels)
+            print(f"{filepath:24} {levels[0][2]:5}x{levels[0][3]:<5} {len(levels):3} levels "
+                  f"{size / 1024:9.1f} KiB {elapsed * 1000:9.1f} ms")
+    print(f"{len(filepaths)} textures in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import numpy
+
+BOX = "box"
+KAISER = "kaiser"
+LANCZOS = "lanczos"
+# radius of each filter in destination texels
+FILTER_RADIUS = {BOX: 0.5, KAISER: 3.0, LANCZOS: 3.0}
+KAISER_ALPHA = 4.0
+
+
+def srgb_to_linear(values):
+    return numpy.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(values):
+    values = numpy.clip(values, 0, 1)
+    return numpy.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1 / 2.4) - 0.055)
+
+
+def lanczos(x, radius):
+    return numpy.sinc(x) * numpy.sinc(x / radius) * (numpy.abs(x) < radius)
+
+
+def kaiser(x, radius):
+    # a sinc windowed by the Kaiser window, with less ringing than Lanczos for the same radius
+    inside = numpy.abs(x) < radius
+    window = numpy.i0(KAISER_ALPHA * numpy.sqrt(numpy.clip(1 - (x / radius) ** 2, 0, 1))) / numpy.i0(KAISER_ALPHA)
+    return numpy.sinc(x) * window * inside
+
+
+def filter_taps(source_size, mip_filter):
+    # source texel indices and weights of every destination texel along one axis, shape (destination size, taps)
+    size = max(source_size // 2, 1)
+    # for odd sizes a destination texel covers a little more than two source texels
+    scale = source_size / size
+    radius = FILTER_RADIUS[mip_filter] * scale
+    centers = (numpy.arange(size) + 0.5) * scale
+    first = numpy.floor(centers - radius).astype(numpy.int64)
+    indices = first[:, None] + numpy.arange(int(numpy.ceil(2 * radius)) + 1)
+
+    if mip_filter == BOX:
+        # exact overlap of each source texel with the footprint of the destination texel
+        low = numpy.maximum(indices, (centers - radius)[:, None])
+        high = numpy.minimum(indices + 1, (centers + radius)[:, None])
+        weights = numpy.maximum(high - low, 0)
+    else:
+        kernel = kaiser if mip_filter == KAISER else lanczos
+        weights = kernel((indices + 0.5 - centers[:, None]) / scale, FILTER_RADIUS[mip_filter])
+
+    # taps past the edges repeat the edge texels
+    indices = numpy.clip(indices, 0, source_size - 1)
+    return indices, (weights / weights.sum(axis=1, keepdims=True)).astype(numpy.float32)
+
+
+def resample_axis(pixels, axis, mip_filter):
+    indices, weights = filter_taps(pixels.shape[axis], mip_filter)
+    shape = [1] * pixels.ndim
+    shape[axis] = len(weights)
+    result = numpy.zeros(pixels.shape[:axis] + (len(weights),) + pixels.shape[axis + 1:], numpy.float32)
+    for tap in range(indices.shape[1]):
+        result += numpy.take(pixels, indices[:, tap], axis) * weights[:, tap].reshape(shape)
+    return result
+
+
+def downsample(pixels, mip_filter=BOX):
+    # float pixels, height x width x channels; separable, first the rows then the columns
+    return resample_axis(resample_axis(pixels, 0, mip_filter), 1, mip_filter)
+
+
+def to_linear(pixels, srgb):
+    # colours are filtered in linear light and weighted by alpha, so transparent texels do not bleed into the result
+    pixels = pixels.astype(numpy.float32) / 255
+    if srgb:
+        pixels[..., :3] = srgb_to_linear(pixels[..., :3])
+    pixels[..., :3] *= pixels[..., 3:]
+    return pixels
+
+
+def from_linear(pixels, srgb):
+    pixels = numpy.clip(pixels, 0, 1)
+    alpha = pixels[..., 3:]
+    color = numpy.divide(pixels[..., :3], alpha, out=numpy.zeros_like(pixels[..., :3]), where=alpha > 0)
+    if srgb:
+        color = linear_to_srgb(color)
+    return numpy.rint(numpy.concatenate([color, alpha], axis=2) * 255).astype(numpy.uint8)
+
+
+def build_mip_chain(pixels, mip_filter=BOX, srgb=True):
+    # RGBA8 levels down to 1x1, each one filtered from the float version of the previous one
+    chain = [pixels]
+    level = to_linear(pixels, srgb)
+    while level.shape[0] > 1 or level.shape[1] > 1:
+        level = downsample(level, mip_filter)
+        chain.append(from_linear(level, srgb))
+    return chain
@@ -0,0 +1,11 @@
+#version 410
+
+in vec3 texCoord;
+out vec4 fragColor;
+
+uniform sampler2DArray tex;
+
+void main()
+{
+    fragColor = texture(tex, texCoord);
+}
@@ -0,0 +1,75 @@
+from ctypes import sizeof, c_void_p
+
+import numpy
+from OpenGL.GL import *
+from PIL import Image
+
+from texture_cache import FORMATS, RGBA8, level_size, mip_sizes, set_parameters, solid_level
+
+# per-instance attributes: a column-major model matrix, the array layer and which uv set of the mesh to use
+INSTANCE = numpy.dtype([("model", "<f4", (4, 4)), ("layer", "<f4"), ("uv_set", "<f4")])
+
+
+def layer_size(filepaths):
+    # every layer of an array has the same size, the largest image decides it; only the image headers are read
+    width = height = 0
+    for filepath in filepaths:
+        with Image.open(filepath) as img:
+            width, height = max(width, img.width), max(height, img.height)
+    return width, height
+
+
+def allocate_texture_array(texture_format, width, height, layers, level_count, parameters, placeholder_color):
+    if layers > glGetIntegerv(GL_MAX_ARRAY_TEXTURE_LAYERS):
+        raise ValueError(f"Texture arrays are limited to {glGetIntegerv(GL_MAX_ARRAY_TEXTURE_LAYERS)} layers")
+
+    tex_id = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D_ARRAY, tex_id)
+    set_parameters(parameters, GL_TEXTURE_2D_ARRAY)
+    internal_format = FORMATS[texture_format][1]
+    for level, (level_width, level_height) in enumerate(mip_sizes(width, height)[:level_count]):
+        if texture_format == RGBA8:
+            glTexImage3D(GL_TEXTURE_2D_ARRAY, level, GL_RGBA8, level_width, level_height, layers, 0, GL_RGBA,
+                         GL_UNSIGNED_BYTE, None)
+        else:
+            glCompressedTexImage3D(GL_TEXTURE_2D_ARRAY, level, internal_format, level_width, level_height, layers, 0,
+                                   layers * level_size(texture_format, level_width, level_height), None)
+
+    # only the first level is sampled until every layer has arrived, it starts out filled with the placeholder
+    placeholder = numpy.tile(solid_level(texture_format, width, height, placeholder_color), layers)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+    if texture_format == RGBA8:
+        glTexSubImage3D(GL_TEXTURE_2D_ARRAY, 0, 0, 0, 0, width, height, layers, GL_RGBA, GL_UNSIGNED_BYTE,
+                        placeholder)
+    else:
+        glCompressedTexSubImage3D(GL_TEXTURE_2D_ARRAY, 0, 0, 0, 0, width, height, layers, internal_format,
+                                  placeholder.nbytes, placeholder)
+    glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAX_LEVEL, 0)
+    glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+    return tex_id
+
+
+def y_rotation_models(translations, angles):
+    # translate(t) * rotate(angle, (0, 1, 0)) for every instance at once, laid out column by column like glm
+    translations = numpy.asarray(translations, numpy.float32)
+    cos, sin = numpy.cos(angles), numpy.sin(angles)
+    models = numpy.zeros((len(translations), 4, 4), numpy.float32)
+    models[:, 0, 0], models[:, 0, 2] = cos, -sin
+    models[:, 1, 1] = 1
+    models[:, 2, 0], models[:, 2, 2] = sin, cos
+    models[:, 3, :3] = translations
+    models[:, 3, 3] = 1
+    return models
+
+
+def bind_instance_attributes(location):
+    # a mat4 attribute takes four locations, one per column; the layer and uv set follow
+    buffer_id = glGenBuffers(1)
+    glBindBuffer(GL_ARRAY_BUFFER, buffer_id)
+    columns = [(location + i, 4, INSTANCE.fields["model"][1] + 4 * i * sizeof(GLfloat)) for i in range(4)]
+    for attribute, size, offset in columns + [(location + 4, 1, INSTANCE.fields["layer"][1]),
+                                              (location + 5, 1, INSTANCE.fields["uv_set"][1])]:
+        glVertexAttribPointer(attribute, size, GL_FLOAT, GL_FALSE, INSTANCE.itemsize, c_void_p(offset))
+        glEnableVertexAttribArray(attribute)
+        glVertexAttribDivisor(attribute, 1)
+    return buffer_id
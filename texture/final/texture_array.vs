@@ -0,0 +1,22 @@
+#version 410
+
+layout (location = 0) in vec3 vPos;
+layout (location = 1) in vec2 vTexCoord0;
+layout (location = 2) in vec2 vTexCoord1;
+layout (location = 3) in vec2 vTexCoord2;
+layout (location = 4) in mat4 instanceModel;
+layout (location = 8) in float instanceLayer;
+layout (location = 9) in float instanceUvSet;
+
+uniform mat4 view;
+uniform mat4 projection;
+
+out vec3 texCoord;
+
+void main()
+{
+    gl_Position = projection * view * instanceModel * vec4(vPos, 1.0);
+    int uvSet = int(instanceUvSet);
+    vec2 uv = uvSet == 0 ? vTexCoord0 : uvSet == 1 ? vTexCoord1 : vTexCoord2;
+    texCoord = vec3(uv, instanceLayer);
+}
@@ -0,0 +1,336 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from ctypes import c_void_p
+
+import numpy
+from OpenGL.GL import *
+from OpenGL.GL.EXT.texture_compression_s3tc import GL_COMPRESSED_RGB_S3TC_DXT1_EXT, GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
+from PIL import Image
+
+from mipmaps import KAISER, build_mip_chain
+
+CACHE_SUFFIX = ".tex"
+MAGIC = b"TEXC"
+VERSION = 2
+DATA_ALIGNMENT = 64
+
+RGBA8 = "rgba8"
+# 4x4 pixel blocks of 8 bytes (opaque colour) and 16 bytes (colour plus interpolated alpha)
+BC1 = "bc1"
+BC3 = "bc3"
+# format: code stored in the header, GL internal format
+FORMATS = {
+    RGBA8: (0, GL_RGBA8),
+    BC1: (1, GL_COMPRESSED_RGB_S3TC_DXT1_EXT),
+    BC3: (2, GL_COMPRESSED_RGBA_S3TC_DXT5_EXT),
+}
+FORMAT_NAMES = {code: name for name, (code, _) in FORMATS.items()}
+
+DEFAULT_PARAMETERS = {
+    GL_TEXTURE_WRAP_S: GL_MIRRORED_REPEAT,
+    GL_TEXTURE_WRAP_T: GL_MIRRORED_REPEAT,
+    GL_TEXTURE_MIN_FILTER: GL_LINEAR_MIPMAP_LINEAR,
+    GL_TEXTURE_MAG_FILTER: GL_NEAREST,
+}
+MIPMAP_FILTERS = (GL_NEAREST_MIPMAP_NEAREST, GL_LINEAR_MIPMAP_NEAREST, GL_NEAREST_MIPMAP_LINEAR,
+                  GL_LINEAR_MIPMAP_LINEAR)
+# mip levels are filtered in linear light, treating the images as sRGB
+DEFAULT_MIP_FILTER = KAISER
+
+# magic, version, source size, source mtime, source sha256, settings sha256, format, width, height, level count;
+# followed by a level entry per mip level and the data of all levels
+HEADER = struct.Struct("<4sIQq32s32sIIII")
+MTIME_OFFSET = struct.calcsize("<4sIQ")
+LEVEL_ENTRY = numpy.dtype([("offset", "<u8"), ("size", "<u8"), ("width", "<u4"), ("height", "<u4")])
+
+
+class TextureLevels:
+    # a mip chain stored back to back in one contiguous byte array, offsets are relative to its start
+    def __init__(self, texture_format, levels, data):
+        self.texture_format = texture_format
+        self.levels = levels
+        self.data = data
+
+    @property
+    def internal_format(self):
+        return FORMATS[self.texture_format][1]
+
+    @property
+    def width(self):
+        return self.levels[0][2]
+
+    @property
+    def height(self):
+        return self.levels[0][3]
+
+    def level_data(self, base, offset, size):
+        # base is None for client memory, or the offset of the data in the bound GL_PIXEL_UNPACK_BUFFER
+        return self.data[offset:offset + size] if base is None else c_void_p(base + offset)
+
+    def upload(self, base=None):
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+        if len(self.levels) > 1:
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(self.levels) - 1)
+        for level, (offset, size, width, height) in enumerate(self.levels):
+            data = self.level_data(base, offset, size)
+            if self.texture_format == RGBA8:
+                glTexImage2D(GL_TEXTURE_2D, level, GL_RGBA8, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, data)
+            else:
+                glCompressedTexImage2D(GL_TEXTURE_2D, level, self.internal_format, width, height, 0, size, data)
+
+    def upload_layer(self, layer, base=None):
+        # into a GL_TEXTURE_2D_ARRAY whose storage has already been allocated with the same size and format
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+        for level, (offset, size, width, height) in enumerate(self.levels):
+            data = self.level_data(base, offset, size)
+            if self.texture_format == RGBA8:
+                glTexSubImage3D(GL_TEXTURE_2D_ARRAY, level, 0, 0, layer, width, height, 1, GL_RGBA,
+                                GL_UNSIGNED_BYTE, data)
+            else:
+                glCompressedTexSubImage3D(GL_TEXTURE_2D_ARRAY, level, 0, 0, layer, width, height, 1,
+                                          self.internal_format, size, data)
+
+
+def file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def settings_digest(texture_format, flip, parameters, size=None, mip_filter=DEFAULT_MIP_FILTER, srgb=True):
+    # everything that changes the stored levels or the texture object built from them
+    settings = (texture_format, bool(flip), sorted((int(name), int(value)) for name, value in parameters.items()),
+                mip_filter, bool(srgb))
+    if size is not None:
+        settings += (tuple(size),)
+    return hashlib.sha256(repr(settings).encode()).digest()
+
+
+def cache_filename_for(filepath, settings):
+    return f"{filepath}.{settings.hex()[:16]}{CACHE_SUFFIX}"
+
+
+def uses_mipmaps(parameters):
+    return parameters.get(GL_TEXTURE_MIN_FILTER, GL_NEAREST_MIPMAP_LINEAR) in MIPMAP_FILTERS
+
+
+def open_image(filepath, size=None):
+    img = Image.open(filepath).convert("RGBA")
+    if size is not None and img.size != tuple(size):
+        # enlarging keeps hard texel edges (matching GL_NEAREST magnification), shrinking filters properly
+        enlarge = img.width <= size[0] and img.height <= size[1]
+        img = img.resize(size, Image.NEAREST if enlarge else Image.LANCZOS)
+    return img
+
+
+def image_pixels(img, flip=False):
+    pixels = numpy.frombuffer(img.tobytes("raw", "RGBA", 0, -1 if flip else 1), numpy.uint8)
+    return pixels.reshape(img.height, img.width, 4)
+
+
+def mip_sizes(width, height):
+    sizes = [(width, height)]
+    while sizes[-1] != (1, 1):
+        sizes.append((max(sizes[-1][0] // 2, 1), max(sizes[-1][1] // 2, 1)))
+    return sizes
+
+
+def level_size(texture_format, width, height):
+    if texture_format == RGBA8:
+        return width * height * 4
+    block_size = 8 if texture_format == BC1 else 16
+    return (width + 3) // 4 * ((height + 3) // 4) * block_size
+
+
+def solid_level(texture_format, width, height, color):
+    # the encoding of a single colour repeats for every pixel (or every block)
+    if texture_format == RGBA8:
+        return numpy.tile(numpy.array(color, numpy.uint8), width * height)
+    block = encode_level(numpy.full((4, 4, 4), color, numpy.uint8), texture_format)
+    return numpy.tile(block, level_size(texture_format, width, height) // block.nbytes)
+
+
+def to_blocks(pixels):
+    # 4x4 blocks in row-major order, partial blocks at the edges are filled by repeating the last pixels
+    height, width = pixels.shape[:2]
+    block_rows, block_columns = (height + 3) // 4, (width + 3) // 4
+    pixels = numpy.pad(pixels, ((0, block_rows * 4 - height), (0, block_columns * 4 - width), (0, 0)), mode="edge")
+    return pixels.reshape(block_rows, 4, block_columns, 4, 4).transpose(0, 2, 1, 3, 4).reshape(-1, 16, 4)
+
+
+def to_565(colors):
+    colors = numpy.clip(numpy.rint(colors * (numpy.array([31, 63, 31]) / 255)), 0, [31, 63, 31]).astype(numpy.uint16)
+    return colors[:, 0] << 11 | colors[:, 1] << 5 | colors[:, 2]
+
+
+def from_565(colors):
+    # expanded the way decoders do it, by replicating the high bits
+    r, g, b = colors >> 11 & 31, colors >> 5 & 63, colors & 31
+    return numpy.stack([r << 3 | r >> 2, g << 2 | g >> 4, b << 3 | b >> 2], axis=1).astype(numpy.float32)
+
+
+def encode_color_blocks(colors):
+    # endpoints from the bounding box of the block, inset slightly since interpolation rarely needs the extremes
+    colors = colors.astype(numpy.float32)
+    low, high = colors.min(axis=1), colors.max(axis=1)
+    inset = (high - low) / 16
+    color_0, color_1 = to_565(high - inset), to_565(low + inset)
+    # color_0 > color_1 selects the four colour mode in BC1
+    swap = color_0 < color_1
+    color_0[swap], color_1[swap] = color_1[swap], color_0[swap]
+
+    end_0, end_1 = from_565(color_0), from_565(color_1)
+    palette = numpy.stack([end_0, end_1, (2 * end_0 + end_1) / 3, (end_0 + 2 * end_1) / 3], axis=1)
+    distances = ((colors[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis=3)
+    indices = distances.argmin(axis=2).astype(numpy.uint32)
+    # when both endpoints are equal every pixel picks index 0, so the three colour mode never shows
+    packed = (indices << (2 * numpy.arange(16, dtype=numpy.uint32))).sum(axis=1, dtype=numpy.uint32)
+
+    blocks = numpy.empty(len(colors), numpy.dtype([("color_0", "<u2"), ("color_1", "<u2"), ("indices", "<u4")]))
+    blocks["color_0"], blocks["color_1"], blocks["indices"] = color_0, color_1, packed
+    return blocks.view(numpy.uint8).reshape(-1, 8)
+
+
+def encode_alpha_blocks(alpha):
+    alpha_0, alpha_1 = alpha.max(axis=1), alpha.min(axis=1)
+    # alpha_0 > alpha_1 selects eight interpolated values, equal endpoints make every index 0 anyway
+    weights = numpy.array([7, 0, 6, 5, 4, 3, 2, 1], numpy.float32) / 7
+    palette = alpha_0[:, None] * weights + alpha_1[:, None] * (1 - weights)
+    indices = numpy.abs(alpha[:, :, None].astype(numpy.float32) - palette[:, None, :]).argmin(axis=2)
+    packed = (indices.astype(numpy.uint64) << (3 * numpy.arange(16, dtype=numpy.uint64))).sum(axis=1,
+                                                                                                dtype=numpy.uint64)
+    blocks = numpy.empty((len(alpha), 8), numpy.uint8)
+    blocks[:, 0], blocks[:, 1] = alpha_0, alpha_1
+    blocks[:, 2:] = packed.astype("<u8").view(numpy.uint8).reshape(-1, 8)[:, :6]
+    return blocks
+
+
+def encode_level(pixels, texture_format):
+    if texture_format == RGBA8:
+        return numpy.ascontiguousarray(pixels).reshape(-1)
+    blocks = to_blocks(pixels)
+    color = encode_color_blocks(blocks[:, :, :3])
+    if texture_format == BC1:
+        return color.reshape(-1)
+    return numpy.hstack([encode_alpha_blocks(blocks[:, :, 3]), color]).reshape(-1)
+
+
+def build_texture_levels(filepath, texture_format, flip=False, mipmaps=True, size=None, mip_filter=DEFAULT_MIP_FILTER,
+                         srgb=True):
+    pixels = image_pixels(open_image(filepath, size), flip)
+    chain = build_mip_chain(pixels, mip_filter, srgb) if mipmaps else [pixels]
+
+    levels = []
+    blocks = []
+    offset = 0
+    for level in chain:
+        encoded = encode_level(level, texture_format)
+        levels.append((offset, encoded.nbytes, level.shape[1], level.shape[0]))
+        blocks.append(encoded)
+        offset += encoded.nbytes
+    return TextureLevels(texture_format, levels, numpy.concatenate(blocks))
+
+
+def write_texture_cache(filepath, settings, texture):
+    source_stat = os.stat(filepath)
+    header = HEADER.pack(MAGIC, VERSION, source_stat.st_size, source_stat.st_mtime_ns, file_digest(filepath),
+                         settings, FORMATS[texture.texture_format][0], texture.width, texture.height,
+                         len(texture.levels))
+    levels = numpy.array(texture.levels, LEVEL_ENTRY)
+    data_offset = align(HEADER.size + levels.nbytes)
+
+    cache_filename = cache_filename_for(filepath, settings)
+    # the loader's worker threads share a process id, two of them may write the same cache at once
+    tmp_filename = f"{cache_filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_filename, "wb") as file:
+            file.write(header)
+            file.write(levels.data)
+            file.write(b"\0" * (data_offset - HEADER.size - levels.nbytes))
+            file.write(texture.data.data)
+        os.replace(tmp_filename, cache_filename)
+    except OSError as e:
+        print(f"Could not write texture cache {cache_filename}: {e}")
+
+
+def align(offset):
+    return (offset + DATA_ALIGNMENT - 1) // DATA_ALIGNMENT * DATA_ALIGNMENT
+
+
+def open_cached_texture(filepath, settings):
+    cache_filename = cache_filename_for(filepath, settings)
+    if not os.path.exists(cache_filename) or os.path.getsize(cache_filename) < HEADER.size:
+        return None
+
+    with open(cache_filename, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    (magic, version, source_size, source_mtime, source_digest, cached_settings, format_code, width, height,
+     level_count) = HEADER.unpack_from(mapped)
+    data_offset = align(HEADER.size + level_count * LEVEL_ENTRY.itemsize)
+    if (magic != MAGIC or version != VERSION or cached_settings != settings or format_code not in FORMAT_NAMES or
+            len(mapped) < data_offset):
+        return None
+    levels = numpy.frombuffer(mapped, LEVEL_ENTRY, level_count, HEADER.size)
+    data_size = int(levels["size"].sum())
+    if len(mapped) != data_offset + data_size:
+        return None
+
+    source_stat = os.stat(filepath)
+    if source_size != source_stat.st_size:
+        return None
+    if source_mtime != source_stat.st_mtime_ns:
+        if source_digest != file_digest(filepath):
+            return None
+        with open(cache_filename, "r+b") as file:
+            file.seek(MTIME_OFFSET)
+            file.write(struct.pack("<q", source_stat.st_mtime_ns))
+
+    levels = [(int(offset), int(size), int(width), int(height)) for offset, size, width, height in levels]
+    return TextureLevels(FORMAT_NAMES[format_code], levels, numpy.frombuffer(mapped, numpy.uint8, data_size,
+                                                                             data_offset))
+
+
+# safe to call from worker threads, nothing here touches the GL context;
+# size resamples the image first, as needed for the layers of a texture array
+def load_texture_levels(filepath, texture_format=RGBA8, flip=False, parameters=None, size=None,
+                        mip_filter=DEFAULT_MIP_FILTER, srgb=True):
+    parameters = DEFAULT_PARAMETERS if parameters is None else parameters
+    if size is not None:
+        with Image.open(filepath) as img:
+            # a layer of the image's own size is not resampled, so it shares the cache of the plain texture
+            size = None if img.size == tuple(size) else size
+    settings = settings_digest(texture_format, flip, parameters, size, mip_filter, srgb)
+    cached = open_cached_texture(filepath, settings)
+    if cached is not None:
+        return cached
+
+    texture = build_texture_levels(filepath, texture_format, flip, uses_mipmaps(parameters), size, mip_filter, srgb)
+    write_texture_cache(filepath, settings, texture)
+    return texture
+
+
+def s3tc_supported():
+    extensions = (glGetStringi(GL_EXTENSIONS, i) for i in range(glGetIntegerv(GL_NUM_EXTENSIONS)))
+    return b"GL_EXT_texture_compression_s3tc" in extensions
+
+
+def set_parameters(parameters, target=GL_TEXTURE_2D):
+    for name, value in parameters.items():
+        glTexParameteri(target, name, value)
+
+
+def load_cached_texture(filepath, texture_format=RGBA8, flip=False, parameters=None):
+    parameters = DEFAULT_PARAMETERS if parameters is None else parameters
+    texture = load_texture_levels(filepath, texture_format, flip, parameters)
+    tex_id = glGenTextures(1)
+    glBindTexture(GL_TEXTURE_2D, tex_id)
+    set_parameters(parameters)
+    texture.upload()
+    glBindTexture(GL_TEXTURE_2D, 0)
+    return tex_id
@@ -6,7 +6,21 @@ import glm
 import numpy
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
-from PIL import Image
+
+from texture_array import INSTANCE, bind_instance_attributes, y_rotation_models
+from texture_cache import BC1
+from texture_loader import AsyncTextureLoader
+from texture_manager import TextureManager
+
+# keep precomputed mip chains of the textures on disk, compressed to BC1 (None decodes the images on every run)
+TEXTURE_CACHE_FORMAT = BC1
+# draw all cubes with one instanced call, taking their textures from the layers of a single texture array
+TEXTURE_ARRAY = True
+# with the texture array, draw a grid of textured cubes instead of the four cubes, still in a single call
+ARRAY_SCENE = False
+ARRAY_SCENE_SIZE = 40
+ARRAY_SCENE_SPACING = 2.5
+ARRAY_SCENE_DEPTH = 80
 
 
 def read_shader_file(filename):
@@ -34,12 +48,25 @@ def init_glfw(width, height, title):
     return window
 
 
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    glBufferData(target, data.nbytes, data, usage)
+
+
 def bind_vertices(vertices, attributes):
-    vertices = (GLfloat * len(vertices))(*vertices)
     array_id = glGenVertexArrays(1)
     glBindVertexArray(array_id)
     glBindBuffer(GL_ARRAY_BUFFER, glGenBuffers(1))
-    glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), vertices, GL_STATIC_DRAW)
+    upload_buffer(GL_ARRAY_BUFFER, vertices)
 
     vertex_size = sum(attributes)
     offset = 0
@@ -77,21 +104,6 @@ def resize(width, height, shader_program):
         glViewport(0, 0, width, height)
 
 
-def load_texture(filepath):
-    img = Image.open(filepath).convert("RGBA")
-    img_data = numpy.array(list(img.getdata()), numpy.uint8)
-    tex_id = glGenTextures(1)
-    glBindTexture(GL_TEXTURE_2D, tex_id)
-    glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_MIRRORED_REPEAT)
-    glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_MIRRORED_REPEAT)
-    glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR)
-    glTexParameter(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
-    glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, img.width, img.height, 0, GL_RGBA, GL_UNSIGNED_BYTE, img_data)
-    glGenerateMipmap(GL_TEXTURE_2D)
-    glBindTexture(GL_TEXTURE_2D, 0)
-    return tex_id
-
-
 def build_cube_1():
     return [
         -1, -1, 1, 0, 1,
@@ -230,6 +242,32 @@ def build_cube_3():
     ]
 
 
+def build_cube_variants():
+    # the three cubes share their positions and differ only in texture coordinates, so one buffer holds all uv sets
+    cubes = [numpy.array(build(), numpy.float32).reshape(-1, 5) for build in (build_cube_1, build_cube_2, build_cube_3)]
+    return numpy.hstack([cubes[0][:, :3]] + [cube[:, 3:] for cube in cubes]).reshape(-1)
+
+
+def build_instances():
+    # wood, gold, lake and canyon layers, with the uv sets of cube_1, cube_1, cube_2 and cube_3
+    uv_sets = numpy.array([0, 0, 1, 2])
+    if ARRAY_SCENE:
+        steps = (numpy.arange(ARRAY_SCENE_SIZE) - (ARRAY_SCENE_SIZE - 1) / 2) * ARRAY_SCENE_SPACING
+        x, y = numpy.meshgrid(steps, steps)
+        translations = numpy.stack([x.ravel(), y.ravel(), numpy.full(x.size, -ARRAY_SCENE_DEPTH)], axis=1)
+        layers = numpy.arange(x.size) % len(uv_sets)
+        phases = numpy.random.default_rng(0).uniform(0, 2 * numpy.pi, x.size)
+    else:
+        translations = numpy.array([(-2, 2, 0), (2, 2, 0), (-2, -2, 0), (2, -2, 0)])
+        layers = numpy.arange(len(uv_sets))
+        phases = numpy.zeros(len(uv_sets))
+
+    instances = numpy.zeros(len(translations), INSTANCE)
+    instances["layer"] = layers
+    instances["uv_set"] = uv_sets[layers]
+    return instances, translations, phases
+
+
 def main():
     width = 1000
     height = 800
@@ -239,18 +277,32 @@ def main():
     glEnable(GL_DEPTH_TEST)
     glEnable(GL_MULTISAMPLE)
 
-    cube_1 = bind_vertices(build_cube_1(), (3, 2))
-    cube_2 = bind_vertices(build_cube_2(), (3, 2))
-    cube_3 = bind_vertices(build_cube_3(), (3, 2))
-
-    shader_program = build_shader("texture")
+    if TEXTURE_ARRAY:
+        cube = bind_vertices(build_cube_variants(), (3, 2, 2, 2))
+        instance_buffer = bind_instance_attributes(4)
+        instances, translations, phases = build_instances()
+        shader_program = build_shader("texture_array")
+    else:
+        cube_1 = bind_vertices(build_cube_1(), (3, 2))
+        cube_2 = bind_vertices(build_cube_2(), (3, 2))
+        cube_3 = bind_vertices(build_cube_3(), (3, 2))
+        shader_program = build_shader("texture")
 
     glUseProgram(shader_program)
 
-    tex_wood = load_texture("../../camera/wood.png")
-    tex_gold = load_texture("../gold.png")
-    tex_lake = load_texture("../lake.png")
-    tex_world = load_texture("../canyon.jpg")
+    if TEXTURE_ARRAY:
+        # the images are decoded in the background, the cubes show a placeholder until their texture arrives
+        loader = AsyncTextureLoader(TEXTURE_CACHE_FORMAT)
+        textures = loader.load_array(["../../camera/wood.png", "../gold.png", "../lake.png", "../canyon.jpg"])
+        glBindTexture(GL_TEXTURE_2D_ARRAY, textures)
+    else:
+        # the separate cubes hold references to textures shared through the manager
+        loader = None
+        manager = TextureManager(texture_format=TEXTURE_CACHE_FORMAT)
+        tex_wood = manager.acquire("../../camera/wood.png")
+        tex_gold = manager.acquire("../gold.png")
+        tex_lake = manager.acquire("../lake.png")
+        tex_world = manager.acquire("../canyon.jpg")
 
     camera_pos = [0, 0, 10]
 
@@ -261,6 +313,9 @@ def main():
     while not glfw.window_should_close(window):
         glfw.poll_events()
 
+        if loader is not None and not loader.finished and loader.poll() > 0 and loader.finished:
+            print(f"Textures loaded in {loader.load_time * 1000:.0f} ms")
+
         if glfw.get_key(window, glfw.KEY_ESCAPE) == glfw.PRESS:
             glfw.set_window_should_close(window, glfw.TRUE)
         if glfw.get_key(window, glfw.KEY_UP) == glfw.PRESS:
@@ -273,36 +328,58 @@ def main():
 
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-        model = glm.translate((-2, 2, 0)) * glm.rotate(glfw.get_time() / 5, (0, 1, 0))
-        glBindVertexArray(cube_1)
-        glBindTexture(GL_TEXTURE_2D, tex_wood)
-        load_matrix_to_shader(shader_program, model, "model")
-        glDrawArrays(GL_TRIANGLES, 0, 36)
-
-        model = glm.translate((2, 2, 0)) * glm.rotate(glfw.get_time() / 5, (0, 1, 0))
-        glBindVertexArray(cube_1)
-        glBindTexture(GL_TEXTURE_2D, tex_gold)
-        load_matrix_to_shader(shader_program, model, "model")
-        glDrawArrays(GL_TRIANGLES, 0, 36)
-
-        model = glm.translate((-2, -2, 0)) * glm.rotate(glfw.get_time() / 5, (0, 1, 0))
-        glBindVertexArray(cube_2)
-        glBindTexture(GL_TEXTURE_2D, tex_lake)
-        load_matrix_to_shader(shader_program, model, "model")
-        glDrawArrays(GL_TRIANGLES, 0, 36)
-
-        model = glm.translate((2, -2, 0)) * glm.rotate(glfw.get_time() / 5, (0, 1, 0))
-        glBindVertexArray(cube_3)
-        glBindTexture(GL_TEXTURE_2D, tex_world)
-        load_matrix_to_shader(shader_program, model, "model")
-        glDrawArrays(GL_TRIANGLES, 0, 36)
+        if TEXTURE_ARRAY:
+            # every cube in one call, the texture layer and uv set come with the model matrix of each instance
+            instances["model"] = y_rotation_models(translations, glfw.get_time() / 5 + phases)
+            glBindBuffer(GL_ARRAY_BUFFER, instance_buffer)
+            upload_buffer(GL_ARRAY_BUFFER, instances.view(numpy.float32), GL_STREAM_DRAW)
+            glBindVertexArray(cube)
+            glDrawArraysInstanced(GL_TRIANGLES, 0, 36, len(instances))
+        else:
+            draw_cubes(shader_program, (cube_1, cube_2, cube_3), (tex_wood, tex_gold, tex_lake, tex_world))
 
         glfw.swap_buffers(window)
 
         time.sleep(0.02)
 
+    if TEXTURE_ARRAY:
+        loader.close()
+    else:
+        for tex_id in (tex_wood, tex_gold, tex_lake, tex_world):
+            manager.release(tex_id)
+        print(manager.report())
+        manager.clear()
     glfw.terminate()
 
 
+def draw_cubes(shader_program, cubes, textures):
+    cube_1, cube_2, cube_3 = cubes
+    tex_wood, tex_gold, tex_lake, tex_world = textures
+
+    model = glm.translate((-2, 2, 0)) * glm.rotate(glfw.get_time() / 5, (0, 1, 0))
+    glBindVertexArray(cube_1)
+    glBindTexture(GL_TEXTURE_2D, tex_wood)
+    load_matrix_to_shader(shader_program, model, "model")
+    glDrawArrays(GL_TRIANGLES, 0, 36)
+
+    model = glm.translate((2, 2, 0)) * glm.rotate(glfw.get_time() / 5, (0, 1, 0))
+    glBindVertexArray(cube_1)
+    glBindTexture(GL_TEXTURE_2D, tex_gold)
+    load_matrix_to_shader(shader_program, model, "model")
+    glDrawArrays(GL_TRIANGLES, 0, 36)
+
+    model = glm.translate((-2, -2, 0)) * glm.rotate(glfw.get_time() / 5, (0, 1, 0))
+    glBindVertexArray(cube_2)
+    glBindTexture(GL_TEXTURE_2D, tex_lake)
+    load_matrix_to_shader(shader_program, model, "model")
+    glDrawArrays(GL_TRIANGLES, 0, 36)
+
+    model = glm.translate((2, -2, 0)) * glm.rotate(glfw.get_time() / 5, (0, 1, 0))
+    glBindVertexArray(cube_3)
+    glBindTexture(GL_TEXTURE_2D, tex_world)
+    load_matrix_to_shader(shader_program, model, "model")
+    glDrawArrays(GL_TRIANGLES, 0, 36)
+
+
 if __name__ == "__main__":
     main()
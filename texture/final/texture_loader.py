@@ -0,0 +1,168 @@
+import ctypes
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+from OpenGL.GL import *
+
+from texture_array import allocate_texture_array, layer_size
+from texture_cache import (BC1, BC3, DEFAULT_PARAMETERS, RGBA8, TextureLevels, image_pixels, load_texture_levels,
+                           mip_sizes, open_image, s3tc_supported, set_parameters, uses_mipmaps)
+
+DECODE_WORKERS = 4
+PBO_RING_SIZE = 3
+PLACEHOLDER_COLOR = (128, 128, 128, 255)
+
+
+def decode_image(filepath, flip=False, size=None):
+    # runs on a worker thread, PIL releases the GIL while decoding, converting and resampling
+    img = open_image(filepath, size)
+    data = image_pixels(img, flip).reshape(-1)
+    return TextureLevels(RGBA8, [(0, data.nbytes, img.width, img.height)], data)
+
+
+class PixelBufferRing:
+    # pixel unpack buffers that are reused round-robin, each one guarded by a fence of the last upload made from it
+    def __init__(self, size):
+        self.buffer_ids = glGenBuffers(size) if size > 1 else [glGenBuffers(1)]
+        self.fences = [None] * size
+        self.next = 0
+
+    def acquire(self):
+        # index of the next buffer if the GPU has finished reading from it, None otherwise
+        fence = self.fences[self.next]
+        if fence is not None:
+            if glClientWaitSync(fence, GL_SYNC_FLUSH_COMMANDS_BIT, 0) == GL_TIMEOUT_EXPIRED:
+                return None
+            glDeleteSync(fence)
+            self.fences[self.next] = None
+        index = self.next
+        self.next = (self.next + 1) % len(self.fences)
+        return index
+
+    def fill(self, index, data):
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, self.buffer_ids[index])
+        # the buffer is respecified to the size of this image, so the driver never has to wait for old contents
+        glBufferData(GL_PIXEL_UNPACK_BUFFER, data.nbytes, None, GL_STREAM_DRAW)
+        pointer = glMapBufferRange(GL_PIXEL_UNPACK_BUFFER, 0, data.nbytes,
+                                   GL_MAP_WRITE_BIT | GL_MAP_INVALIDATE_BUFFER_BIT)
+        ctypes.memmove(pointer, data.ctypes.data, data.nbytes)
+        glUnmapBuffer(GL_PIXEL_UNPACK_BUFFER)
+
+    def release(self, index):
+        self.fences[index] = glFenceSync(GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+    def delete(self):
+        for fence in self.fences:
+            if fence is not None:
+                glDeleteSync(fence)
+        glDeleteBuffers(len(self.buffer_ids), self.buffer_ids)
+
+
+class AsyncTextureLoader:
+    # textures are handed out immediately with a placeholder pixel and replaced once their image is decoded,
+    # with a cache format the whole mip chain is read from (or first written to) the texture cache instead
+    def __init__(self, cache_format=None, workers=DECODE_WORKERS, ring_size=PBO_RING_SIZE):
+        if cache_format in (BC1, BC3) and not s3tc_supported():
+            print("S3TC texture compression is not supported, caching uncompressed textures")
+            cache_format = RGBA8
+        self.cache_format = cache_format
+        self.executor = ThreadPoolExecutor(workers)
+        self.ring = PixelBufferRing(ring_size)
+        self.pending = []
+        # texture array id: [layers still loading, mip level count]
+        self.arrays = {}
+        self.start_time = time.perf_counter()
+        self.load_time = None
+
+    def load(self, filepath, flip=False, parameters=None):
+        parameters = DEFAULT_PARAMETERS if parameters is None else parameters
+        tex_id = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, tex_id)
+        set_parameters(parameters)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, 1, 1, 0, GL_RGBA, GL_UNSIGNED_BYTE,
+                     numpy.array(PLACEHOLDER_COLOR, numpy.uint8))
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        self.submit(tex_id, None, filepath, flip, parameters)
+        return tex_id
+
+    def load_array(self, filepaths, flip=False, parameters=None):
+        # one GL_TEXTURE_2D_ARRAY with a layer per image, resampled to the size of the largest one
+        parameters = DEFAULT_PARAMETERS if parameters is None else parameters
+        width, height = layer_size(filepaths)
+        level_count = len(mip_sizes(width, height)) if uses_mipmaps(parameters) else 1
+        tex_id = allocate_texture_array(self.cache_format or RGBA8, width, height, len(filepaths), level_count,
+                                        parameters, PLACEHOLDER_COLOR)
+        self.arrays[tex_id] = [len(filepaths), level_count]
+        for layer, filepath in enumerate(filepaths):
+            self.submit(tex_id, layer, filepath, flip, parameters, (width, height))
+        return tex_id
+
+    def submit(self, tex_id, layer, filepath, flip, parameters, size=None):
+        if self.cache_format is None:
+            future = self.executor.submit(decode_image, filepath, flip, size)
+        else:
+            future = self.executor.submit(load_texture_levels, filepath, self.cache_format, flip, parameters, size)
+        self.pending.append((tex_id, layer, parameters, future))
+
+    @property
+    def finished(self):
+        return not self.pending
+
+    def poll(self):
+        # called once per frame on the GL thread, uploads at most one image per free pixel buffer
+        uploaded = 0
+        while uploaded < len(self.ring.fences):
+            ready = next((item for item in self.pending if item[3].done()), None)
+            if ready is None:
+                break
+            index = self.ring.acquire()
+            if index is None:
+                break
+            self.pending.remove(ready)
+            tex_id, layer, parameters, future = ready
+            self.upload(tex_id, layer, index, parameters, future.result())
+            uploaded += 1
+
+        if uploaded > 0 and self.finished:
+            self.load_time = time.perf_counter() - self.start_time
+        return uploaded
+
+    def upload(self, tex_id, layer, index, parameters, texture):
+        # all levels are copied into the pixel buffer at once, they are then specified from offsets into it
+        self.ring.fill(index, texture.data)
+        if layer is None:
+            glBindTexture(GL_TEXTURE_2D, tex_id)
+            texture.upload(base=0)
+            if len(texture.levels) == 1 and uses_mipmaps(parameters):
+                glGenerateMipmap(GL_TEXTURE_2D)
+            glBindTexture(GL_TEXTURE_2D, 0)
+        else:
+            glBindTexture(GL_TEXTURE_2D_ARRAY, tex_id)
+            texture.upload_layer(layer, base=0)
+            self.finish_layer(tex_id, len(texture.levels))
+            glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+        self.ring.release(index)
+        glBindBuffer(GL_PIXEL_UNPACK_BUFFER, 0)
+
+    def finish_layer(self, tex_id, uploaded_levels):
+        self.arrays[tex_id][0] -= 1
+        layers_left, level_count = self.arrays[tex_id]
+        if layers_left > 0:
+            return
+        del self.arrays[tex_id]
+        # the mip levels are sampled once every layer has them
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAX_LEVEL, level_count - 1)
+        if uploaded_levels < level_count:
+            glGenerateMipmap(GL_TEXTURE_2D_ARRAY)
+
+    def wait(self):
+        while not self.finished:
+            if self.poll() == 0:
+                time.sleep(0.001)
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.ring.delete()
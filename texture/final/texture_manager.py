@@ -0,0 +1,110 @@
+from collections import OrderedDict
+
+from OpenGL.GL import *
+
+from texture_cache import (BC1, BC3, DEFAULT_PARAMETERS, RGBA8, load_texture_levels, s3tc_supported, set_parameters,
+                           uses_mipmaps)
+from texture_loader import decode_image
+
+DEFAULT_BUDGET = 256 * 2 ** 20
+
+
+class TextureEntry:
+    def __init__(self):
+        self.tex_id = None
+        self.size = 0
+        self.references = 0
+
+
+class TextureManager:
+    # reference counted textures; unreferenced ones stay resident until the byte budget is exceeded,
+    # then the least recently used are deleted and later reloaded from the texture cache when asked for again;
+    # a texture_format of None decodes the images instead, on every load
+    def __init__(self, budget=DEFAULT_BUDGET, texture_format=RGBA8):
+        if texture_format in (BC1, BC3) and not s3tc_supported():
+            print("S3TC texture compression is not supported, caching uncompressed textures")
+            texture_format = RGBA8
+        self.budget = budget
+        self.texture_format = texture_format
+        # least recently used first
+        self.entries = OrderedDict()
+        self.ids = {}
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loaded_bytes = 0
+        self.evicted_bytes = 0
+
+    def acquire(self, filepath, flip=False, parameters=None):
+        parameters = DEFAULT_PARAMETERS if parameters is None else parameters
+        key = (filepath, bool(flip), tuple(sorted(parameters.items())))
+        entry = self.entries.setdefault(key, TextureEntry())
+        self.entries.move_to_end(key)
+
+        if entry.tex_id is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.load(key, entry, parameters)
+        entry.references += 1
+        self.evict()
+        return entry.tex_id
+
+    def load(self, key, entry, parameters):
+        filepath, flip, _ = key
+        if self.texture_format is None:
+            texture = decode_image(filepath, flip)
+        else:
+            texture = load_texture_levels(filepath, self.texture_format, flip, parameters)
+        entry.tex_id = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, entry.tex_id)
+        set_parameters(parameters)
+        texture.upload()
+        if len(texture.levels) == 1 and uses_mipmaps(parameters):
+            glGenerateMipmap(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        entry.size = texture.data.nbytes
+        self.ids[entry.tex_id] = key
+        self.resident_bytes += entry.size
+        self.loaded_bytes += entry.size
+
+    def release(self, tex_id):
+        # an evicted texture is no longer known by its id
+        entry = self.entries[self.ids[tex_id]] if tex_id in self.ids else None
+        if entry is None or entry.references <= 0:
+            raise ValueError(f"Texture {tex_id} is not acquired")
+        entry.references -= 1
+        self.evict()
+
+    def evict(self):
+        # referenced textures are never deleted, so the budget can be exceeded while they are in use
+        for key, entry in list(self.entries.items()):
+            if self.resident_bytes <= self.budget:
+                break
+            if entry.references == 0 and entry.tex_id is not None:
+                self.delete(key, entry)
+
+    def delete(self, key, entry):
+        glDeleteTextures(1, [entry.tex_id])
+        del self.ids[entry.tex_id]
+        del self.entries[key]
+        self.resident_bytes -= entry.size
+        self.evictions += 1
+        self.evicted_bytes += entry.size
+
+    def clear(self):
+        for key, entry in list(self.entries.items()):
+            if entry.tex_id is not None:
+                glDeleteTextures(1, [entry.tex_id])
+        self.entries.clear()
+        self.ids.clear()
+        self.resident_bytes = 0
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups > 0 else 0
+        return (f"{len(self.ids)} resident, {self.resident_bytes / 2 ** 20:.1f} / {self.budget / 2 ** 20:.1f} MiB, "
+                f"{self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), {self.evictions} evictions, "
+                f"{self.loaded_bytes / 2 ** 20:.1f} MiB loaded, {self.evicted_bytes / 2 ** 20:.1f} MiB evicted")
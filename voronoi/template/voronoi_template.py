@@ -36,12 +36,25 @@ def init_glfw(width, height, title):
     return window
 
 
+def upload_buffer(target, data, usage=GL_STATIC_DRAW, dtype=numpy.float32):
+    if isinstance(data, (list, tuple)):
+        data = numpy.asarray(data, dtype)
+    elif memoryview(data).format == "B":
+        data = numpy.frombuffer(data, dtype)
+    else:
+        data = numpy.asarray(data)
+        if data.dtype != dtype:
+            raise ValueError(f"Expected {numpy.dtype(dtype)} buffer data, got {data.dtype}")
+        if not data.flags.c_contiguous:
+            raise ValueError("Buffer data must be contiguous")
+    glBufferData(target, data.nbytes, data, usage)
+
+
 def bind_vertices(vertices, attributes):
-    vertices = (GLfloat * len(vertices))(*vertices)
     array_id = glGenVertexArrays(1)
     glBindVertexArray(array_id)
     glBindBuffer(GL_ARRAY_BUFFER, glGenBuffers(1))
-    glBufferData(GL_ARRAY_BUFFER, len(vertices) * sizeof(GLfloat), vertices, GL_STATIC_DRAW)
+    upload_buffer(GL_ARRAY_BUFFER, vertices)
 
     vertex_size = sum(attributes)
     offset = 0
@@ -84,7 +97,7 @@ class Point:
 
 def update_buffer(buffer, data):
     glBindBuffer(GL_UNIFORM_BUFFER, buffer)
-    glBufferData(GL_UNIFORM_BUFFER, data.size * sizeof(GLfloat), data, GL_DYNAMIC_DRAW)
+    upload_buffer(GL_UNIFORM_BUFFER, data, GL_DYNAMIC_DRAW)
 
 
 def get_pos_data(points):